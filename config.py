@@ -5,8 +5,68 @@ class Config(object):
     epochs = 100
     lr = 0.0001
     l2Reg = 1.0e-6
+    # weights of the selection sparsity and coherence costs of the token
+    # head; the coherence weight is sparsity_factor * coherent_ratio
+    sparsity_factor = 0.3
+    coherent_ratio = 2.0
+    # generator architecture (see RNNGeneratorModel): recurrent cell
+    # ('rnn', 'gru' or 'lstm'), layers of the bidirectional generator and
+    # selection head ('token' keeps or drops every word, 'span' picks one
+    # window of span_len words scored by a convolution, 'span_lstm' one
+    # scored by a recurrent encoder)
+    cell_type = 'rnn'
+    n_layers = 2
+    selection = 'token'
+    # aspect columns trained jointly, with one selection and prediction head
+    # each on a shared generator (None trains only the model's aspect), and
+    # the weight of each aspect's loss (None weighs them equally)
+    aspects = None
+    aspect_weights = None
+    # graph towers a training batch is split over; each tower's loss is its
+    # share of the batch loss and their gradients are summed into one update
+    # (see generator_scaling.py)
+    n_towers = 1
+    # data files read by generator.main (None uses the paths in generator.py)
+    train_path = None
+    dev_path = None
+    embedding_path = None
+    test_path = None
+    annotations_path = None
+    # checkpoint written by fit; the frozen graph goes next to it as .pb
+    weights_path = './generator.weights'
+    # full training state (variables, Adam slots, counters, RNG and position
+    # in the epoch), written in the background every checkpoint_every_steps
+    # training steps or checkpoint_every_minutes minutes (0 disables either)
+    # and at the end of every epoch; `generator.py --resume` continues from
+    # it. None turns these checkpoints off
+    checkpoint_path = './generator.ckpt'
+    checkpoint_every_steps = 500
+    checkpoint_every_minutes = 10
+    # score dev and test at the end of every training epoch; False leaves it
+    # to a generator_evaluator.py process watching checkpoint_path
+    evaluate_in_training = True
+    # number of length buckets used to batch reviews of similar length
+    n_buckets = 8
+    # length policy picking max_sentence (see apply_length_policy):
+    # 'percentile' truncates to length_percentile of the training lengths,
+    # 'buckets' pads each bucket to its entry in bucket_caps and 'fixed'
+    # always uses length_cap
+    length_policy = 'percentile'
+    length_percentile = 95.0
+    length_cap = 300
+    bucket_caps = [50, 100, 200, 300]
+    # training batches built ahead by a background thread (0 disables it)
+    prefetch_batches = 4
+    # stream the training file every epoch instead of loading it into memory
+    stream_train = False
+    shuffle_window = 10000
+    # storage type of the embedding matrix; 'float16' halves its memory and
+    # the looked-up vectors are upcast to float32
+    embedding_dtype = 'float32'
     # built when we construct the model
     max_sentence = 0
     n_class = 0
     embedding_size = 0
     span_len = 10
+    # span lengths scored at test time by the span generators (span_len is always added)
+    eval_span_lens = [5, 10, 20]
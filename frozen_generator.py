@@ -0,0 +1,116 @@
+import numpy as np
+import tensorflow as tf
+
+from preprocess import myio_load_vocab, myio_load_checkpoint_meta, RaggedArray
+
+'''
+Batch scoring with a frozen generator graph
+'''
+
+class FrozenGenerator(object):
+    '''
+        Rationale generator loaded from the frozen inference graph written by
+        RNNGeneratorModel.export_inference_graph. Needs only the graph file
+        and the vocabulary / metadata files next to it: no training data,
+        embedding file or training graph is loaded.
+
+        Inputs
+        ------
+
+        path            : path of the exported graph, e.g. ./generator.pb
+        aspect          : aspect whose head is used, for a graph exported
+                          from a multi-aspect model (default: its first)
+    '''
+    def __init__(self, path, aspect=None):
+        meta = myio_load_checkpoint_meta(path)
+        self.max_sentence = meta['max_sentence']
+        self.maskId = meta['mask_id']
+        aspects = meta.get('aspects', [meta['aspect']])
+        self.aspect = aspects[0] if aspect is None else aspect
+        if self.aspect not in aspects:
+            raise ValueError("{:} has no head for aspect {:}".format(path, self.aspect))
+        prefix = '' if len(aspects) == 1 else 'aspect{:}/'.format(self.aspect)
+        # graphs exported before the selection head was configurable are
+        # token graphs
+        self.selection = meta.get('selection', 'token')
+        self.span_len = meta.get('span_len', 0)
+
+        self.lst_words = myio_load_vocab(path)
+        self.vocab_map = dict((w, i) for i, w in enumerate(self.lst_words))
+        self.oov_id = self.vocab_map["<unk>"]
+
+        graph_def = tf.GraphDef()
+        with tf.gfile.GFile(path, 'rb') as f:
+            graph_def.ParseFromString(f.read())
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.import_graph_def(graph_def, name='')
+        self.inputPH = self.graph.get_tensor_by_name('input:0')
+        self.maskPH = self.graph.get_tensor_by_name('mask:0')
+        self.seqPH = self.graph.get_tensor_by_name('sequenceLen:0')
+        self.dropoutPH = self.graph.get_tensor_by_name('dropout:0')
+        self.zPreds = self.graph.get_tensor_by_name(prefix + 'zPreds:0')
+        self.pred = self.graph.get_tensor_by_name(prefix + 'scorePred:0')
+        self.sess = tf.Session(graph=self.graph)
+
+    def close(self):
+        self.sess.close()
+
+    def map_to_ids(self, reviews):
+        '''
+        Map tokenized reviews to a RaggedArray of ids; unknown words get <unk>
+        '''
+        vocab_map, oov_id = self.vocab_map, self.oov_id
+        lengths = [ len(review) for review in reviews ]
+        offsets = np.zeros(len(reviews) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        ids = np.fromiter((vocab_map.get(w, oov_id) for review in reviews for w in review),
+                          dtype=np.int32, count=offsets[-1])
+        return RaggedArray(ids, offsets)
+
+    def pad(self, rows, indices):
+        '''
+        Pad rows @indices of @rows to their longest review, truncated to
+        max_sentence tokens
+        '''
+        width = min(max(int(rows.lengths[indices].max()), 1), self.max_sentence)
+        if self.selection in ('span', 'span_lstm'):
+            # the span heads need at least one start word
+            width = max(width, self.span_len + 1)
+        return rows.pad(indices, self.maskId, width)
+
+    def predict_batch(self, x, mask, sentLen):
+        '''
+        Run one padded batch (as built by RaggedArray.pad)
+        :return: aspect scores (batch,) and 0/1 rationale matrix (batch x width)
+        '''
+        feed = {self.inputPH: x,
+                self.maskPH: mask,
+                self.seqPH: sentLen,
+                self.dropoutPH: 1.0}
+        scores, zPreds = self.sess.run([self.pred, self.zPreds], feed_dict=feed)
+        if self.selection in ('span', 'span_lstm'):
+            # zPreds holds the start word of each review's span and scores
+            # the score of every start
+            starts = zPreds.astype(np.int64)
+            positions = np.arange(x.shape[1])
+            rationale = (positions >= starts[:, None]) & (positions < starts[:, None] + self.span_len)
+            return scores[np.arange(len(starts)), starts], rationale.astype(np.int32)
+        return scores[:, 0], np.round(zPreds).astype(np.int32)
+
+    def predict(self, reviews, batch_size=256):
+        '''
+        Score tokenized reviews, truncated to max_sentence tokens
+        :return: aspect scores (n,) and, for each review, the 0/1 rationale
+        of each of its (kept) tokens
+        '''
+        rows = self.map_to_ids(reviews)
+        scores = np.zeros(len(rows), dtype=np.float32)
+        rationales = [ ]
+        for start in xrange(0, len(rows), batch_size):
+            indices = np.arange(start, min(start + batch_size, len(rows)))
+            x, mask, sentLen = self.pad(rows, indices)
+            batch_scores, zPreds = self.predict_batch(x, mask, sentLen)
+            scores[indices] = batch_scores
+            rationales.extend(z[:l] for z, l in zip(zPreds, sentLen))
+        return scores, rationales
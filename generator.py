@@ -1,7 +1,14 @@
+import os
+import argparse
+import itertools
+from contextlib import contextmanager
 import numpy as np
 import tensorflow as tf
 from tensorflow.contrib import rnn
-from preprocess import readOurData
+from tensorflow.python.framework import graph_util
+from tensorflow.python.util import nest
+from preprocess import readOurData, myio_save_vocab, myio_save_checkpoint_meta
+from preprocess import myio_load_vocab, myio_load_checkpoint_meta, RaggedArray
 from model import Model
 import time
 
@@ -12,7 +19,10 @@ from utils.parser_utils import minibatches, load_and_preprocess_data
 from rnncell import RNNCell
 from config import Config
 from encoderGen import RNNEncoderModel
-from utils.general_utils import get_minibatches_test
+from utils.general_utils import get_ragged_minibatches, apply_length_policy
+from utils.general_utils import get_bucket_batches, get_bucketed_minibatches
+from utils.general_utils import BatchPrefetcher, AsyncCheckpointWriter, load_checkpoint
+from rationales_tensor import read_rationales_as_arrays, rationale_prefix_sums, span_precision_recall
 
 '''
 Set up classes and functions
@@ -20,47 +30,61 @@ Set up classes and functions
 
 class RNNGeneratorModel(object):
     def build(self):
-        self.add_placeholders()
-        self.pred = self.add_prediction_op()
-        self.loss = self.add_loss_op(self.pred)
-        self.train_op = self.add_training_op(self.loss)
-        self.eval = self.evaluate(self.pred)
-        self.predCorrect, self.predTotal = self.get_batch_precision()
-
-    def _read_data(self, train_path, dev_path, testPath, embedding_path):
-        '''
-        Helper function to read in our data. Used to construct our RNNModel
-        :param train_path: path to training data
-        :param dev_path: path to development data
-        :param embedding_path: path to embeddings
-        :return: read in training/development data with padding masks and
-        embedding dictionaries
-        '''
-        from preprocess import readOurData
-        train_x_pad, train_y, train_mask, train_sentLen, dev_x_pad, dev_y, dev_mask, dev_sentLen, embedding_pad, test_x_pad, test_y, test_mask, test_sentLen = readOurData(
-            train_path, dev_path, testPath,embedding_path)
-        return train_x_pad, train_y, train_mask, train_sentLen, dev_x_pad, dev_y, dev_mask, dev_sentLen, embedding_pad, test_x_pad, test_y, test_mask, test_sentLen
-
-    def _get_rationals(self, rationals):
-        from rationales_tensor import read_rationales_as_array
-        rational = read_rationales_as_array(rationals)
-        return rational
+        self.add_embedding_store()
+        # every tower has its own placeholders and shares the variables of
+        # tower 0, whose tensors are the ones kept on the model
+        self.towers = [ ]
+        for i in range(self.config.n_towers):
+            with self.tower_scope(i):
+                self.add_placeholders()
+                self.pred = self.add_prediction_op()
+                self.loss = self.add_loss_op(self.pred)
+                self.eval = self.evaluate(self.pred)
+            self.towers.append({'inputPH': self.inputPH,
+                                'labelsPH': self.labelsPH,
+                                'maskPH': self.maskPH,
+                                'dropoutPH': self.dropoutPH,
+                                'seqPH': self.seqPH,
+                                'l2RegPH': self.l2RegPH,
+                                'rowWeightsPH': self.rowWeightsPH,
+                                'pred': self.pred,
+                                'zPreds': self.zPreds,
+                                'aspectZPreds': self.aspectZPreds,
+                                'loss': self.loss,
+                                'eval': self.eval})
+        for name, tensor in self.towers[0].items():
+            setattr(self, name, tensor)
+        self.train_op = self.add_training_op([tower['loss'] for tower in self.towers])
+        # model and optimizer (Adam slot) variables, saved by save_checkpoint
+        self.checkpoint_vars = tf.global_variables()
+
+    @contextmanager
+    def tower_scope(self, i):
+        # tower 0 is built at the top level, so a model with any number of
+        # towers has the variables, placeholders and outputs of a single
+        # tower model (same checkpoints and exported graphs); the other
+        # towers reuse its variables
+        with tf.variable_scope(tf.get_variable_scope(), reuse=i > 0):
+            if i == 0:
+                yield
+            else:
+                with tf.name_scope('tower{:}'.format(i)):
+                    yield
 
     def add_placeholders(self):
-        # batchSize X sentence X numClasses
+        # batchSize X sentence; batches are padded to their length bucket,
+        # so the sentence dimension varies (up to max_sentence)
         self.inputPH = tf.placeholder(dtype=tf.int32,
-                                      shape=(None,
-                                             self.config.max_sentence),
+                                      shape=(None, None),
                                       name='input')
-        # batchSize X numClasses
+        # batchSize X aspects
         self.labelsPH = tf.placeholder(dtype=tf.float32,
                                        shape=(None,
-                                              self.config.n_class),
+                                              len(self.aspects)),
                                        name='labels')
         # mask over sentences not long enough
         self.maskPH = tf.placeholder(dtype=tf.bool,
-                                     shape=(None,
-                                            self.config.max_sentence),
+                                     shape=(None, None),
                                      name='mask')
         self.dropoutPH = tf.placeholder(dtype=tf.float32,
                                         shape=(),
@@ -71,11 +95,14 @@ class RNNGeneratorModel(object):
         self.l2RegPH = tf.placeholder(dtype=tf.float32,
                                       shape=(),
                                       name='l2Reg')
-        self.rationalsPH = tf.placeholder(dtype = tf.float32,
-                                        shape = (None, self.config.max_sentence),
-                                        name = 'rationals')
-
-    def create_feed_dict(self, inputs_batch, mask_batch, seqLen, labels_batch=None, rationals=None,
+        # weight of every review in the loss: 1 / (reviews in the whole
+        # training batch), 0 for the repeated reviews that fill the towers
+        # of a short batch
+        self.rowWeightsPH = tf.placeholder(dtype=tf.float32,
+                                           shape=(None,),
+                                           name='rowWeights')
+
+    def create_feed_dict(self, inputs_batch, mask_batch, seqLen, labels_batch=None,
                          dropout=1.0, l2_reg=0.0):
 
         feed_dict = {
@@ -89,67 +116,115 @@ class RNNGeneratorModel(object):
         # Add labels if not none
         if labels_batch is not None:
             feed_dict[self.labelsPH] = labels_batch
-
-        if rationals is not None:
-            feed_dict[self.rationalsPH] = rationals
+            feed_dict[self.rowWeightsPH] = np.full(len(labels_batch), 1.0 / len(labels_batch),
+                                                   dtype=np.float32)
 
         return feed_dict
 
-    def add_embedding(self):
-        embedding_shape = (-1,
-                           self.config.max_sentence,
-                           self.config.embedding_size)
+    def create_tower_feed_dict(self, inputs_batch, mask_batch, seqLen, labels_batch,
+                               dropout=1.0, l2_reg=0.0):
+        '''
+        Shards a batch over the towers in contiguous slices of (nearly) equal
+        size; a batch with fewer reviews than towers repeats some of them,
+        with a zero weight so they count neither in the loss nor in the
+        squared error
+        '''
+        n_towers = len(self.towers)
+        if n_towers == 1:
+            return self.create_feed_dict(inputs_batch, mask_batch, seqLen, labels_batch,
+                                         dropout=dropout, l2_reg=l2_reg)
+        n_rows = len(inputs_batch)
+        weights = np.full(n_rows, 1.0 / n_rows, dtype=np.float32)
+        arrays = (inputs_batch, mask_batch, seqLen, labels_batch, weights)
+        if n_rows < n_towers:
+            rows = np.resize(np.arange(n_rows), n_towers)
+            arrays = [ a[rows] for a in arrays ]
+            arrays[-1][n_rows:] = 0.0
+        shards = zip(*[ np.array_split(a, n_towers) for a in arrays ])
+
+        feed_dict = { }
+        for tower, (x, mask, sentLen, y, w) in zip(self.towers, shards):
+            feed_dict.update({
+                tower['inputPH']: x,
+                tower['maskPH']: mask,
+                tower['seqPH']: sentLen,
+                tower['labelsPH']: y,
+                tower['rowWeightsPH']: w,
+                tower['dropoutPH']: dropout,
+                tower['l2RegPH']: l2_reg
+            })
+        return feed_dict
 
-        pretrainEmbeds = tf.constant(self.pretrained_embeddings,
-                                     dtype=tf.float32)
-        embeddings = tf.nn.embedding_lookup(pretrainEmbeds, self.inputPH)
-        embeddings = tf.reshape(embeddings, shape=embedding_shape)
+    def init_embeddings(self, sess):
+        sess.run(self.embeddingStore.initializer,
+                 feed_dict={self.embeddingPH: self.pretrained_embeddings})
 
+    def embedding_lookup(self, ids):
+        embeddings = tf.nn.embedding_lookup(self.embeddingStore, ids)
+        # float16 storage is upcast after the gather, so only the
+        # looked-up rows are converted
+        if self.embeddingStore.dtype != tf.float32:
+            embeddings = tf.cast(embeddings, tf.float32)
         return embeddings
 
-    def add_prediction_op(self):
+    def add_embedding_store(self):
+        # one variable, kept in its storage dtype (float32 or float16), holds
+        # the matrix for every lookup of every tower. It is filled from
+        # embeddingPH by init_embeddings instead of being baked into the
+        # GraphDef, and collections=[] keeps it out of the checkpoint
+        self.embeddingPH = tf.placeholder(
+            dtype=tf.as_dtype(self.pretrained_embeddings.dtype),
+            shape=self.pretrained_embeddings.shape,
+            name='embeddingInit')
+        self.embeddingStore = tf.Variable(self.embeddingPH,
+                                          trainable=False,
+                                          collections=[],
+                                          name='embeddings')
 
-        # get relevent embedding data
-        x = self.add_embedding()
-        currBatch = tf.shape(x)[0]
-        xDrop = tf.nn.dropout(x, self.dropoutPH)
-        xRev = tf.reverse(xDrop, dims = [False, True, False])
-        # embeds = tf.concat(concat_dim=1, values = [xDrop, xRev])
+    def add_embedding(self):
+        # batchSize X sentence X embeddingSize
+        embeddings = self.embedding_lookup(self.inputPH)
 
-        # Extract sizes
+        return embeddings
+
+    def make_cell(self, num_units):
+        '''
+        One recurrent cell of config.cell_type ('rnn', 'gru' or 'lstm') with
+        dropout on its output
+        '''
+        cell_type = self.config.cell_type
+        if cell_type == 'rnn':
+            cell = tf.nn.rnn_cell.BasicRNNCell(num_units = num_units,
+                                               activation = tf.tanh)
+        elif cell_type == 'gru':
+            cell = tf.nn.rnn_cell.GRUCell(num_units = num_units,
+                                          activation = tf.tanh)
+        elif cell_type == 'lstm':
+            cell = tf.nn.rnn_cell.LSTMCell(num_units = num_units,
+                                           activation = tf.tanh)
+        else:
+            raise ValueError("unknown cell_type: {:}".format(cell_type))
+        return tf.nn.rnn_cell.DropoutWrapper(cell,
+                                             output_keep_prob=self.dropoutPH)
+
+    def flatten_states(self, states):
+        # final state of every layer (of both directions, and both the c and
+        # h parts of an LSTM) side by side: batchSize X stateSize
+        return tf.concat(concat_dim = 1, values = nest.flatten(states))
+
+    def add_generator(self, x):
+        '''
+        Bidirectional stack of config.n_layers cells over the review
+        :return: final states, batchSize X stateSize
+        '''
+        currBatch = tf.shape(x)[0]
         hidden_size = self.config.hidden_size
-        n_class = self.config.n_class
-        batch_size = self.config.batch_size
-        max_sentence = self.config.max_sentence
-        embedding_size = self.config.embedding_size
+        n_layers = self.config.n_layers
 
-        # Define internal RNN Cells
-        genCell1Layer1 = tf.nn.rnn_cell.BasicRNNCell(num_units = hidden_size,
-                                                     # input_size = embedding_size,
-                                                     activation = tf.tanh)
-        genCell2Layer1 = tf.nn.rnn_cell.BasicRNNCell(num_units = hidden_size,
-                                                     # input_size = embedding_size,
-                                                     activation = tf.tanh)
-        genCell1Layer2 = tf.nn.rnn_cell.BasicRNNCell(num_units = hidden_size,
-                                                     # input_size = hidden_size,
-                                                     activation = tf.tanh)
-        genCell2Layer2 = tf.nn.rnn_cell.BasicRNNCell(num_units = hidden_size,
-                                                     # input_size = hidden_size,
-                                                     activation = tf.tanh)
-
-        # Apply dropout to each cell
-        genC1L1Drop = tf.nn.rnn_cell.DropoutWrapper(genCell1Layer1,
-                                                    output_keep_prob=self.dropoutPH)
-        genC2L1Drop = tf.nn.rnn_cell.DropoutWrapper(genCell2Layer1,
-                                                    output_keep_prob=self.dropoutPH)
-        genC1L2Drop = tf.nn.rnn_cell.DropoutWrapper(genCell1Layer2,
-                                                    output_keep_prob=self.dropoutPH)
-        genC2L2Drop = tf.nn.rnn_cell.DropoutWrapper(genCell2Layer2,
-                                                    output_keep_prob=self.dropoutPH)
-
-        # Stack each for multi Cell
-        multiFwd = tf.nn.rnn_cell.MultiRNNCell([genC1L1Drop, genC1L2Drop])
-        multiBwd = tf.nn.rnn_cell.MultiRNNCell([genC2L1Drop, genC2L2Drop])
+        multiFwd = tf.nn.rnn_cell.MultiRNNCell([self.make_cell(hidden_size)
+                                                for _ in range(n_layers)])
+        multiBwd = tf.nn.rnn_cell.MultiRNNCell([self.make_cell(hidden_size)
+                                                for _ in range(n_layers)])
 
         # Set inital states
         fwdInitState = multiFwd.zero_state(batch_size = currBatch,
@@ -165,18 +240,64 @@ class RNNGeneratorModel(object):
                                                     dtype = tf.float32,
                                                     sequence_length = self.seqPH
                                                     )
+        return self.flatten_states(states)
+
+    def selects_span(self):
+        # the span heads pick one start word per review instead of a mask
+        return self.config.selection in ('span', 'span_lstm')
 
-        # states returns tuple (fwdState, bwdState) where each is a 3-d tensor
-        # of (depth, batchsize, hiddendim). unpack axis 0 to get each final state
-        unpackedStates1 = tf.unpack(states[0], axis = 0)
-        unpackedStates2 = tf.unpack(states[1], axis = 0)
-        states = unpackedStates1 + unpackedStates2
+    def head_scope(self, k):
+        # the heads of a single-aspect model keep unscoped names, so its
+        # checkpoints and exported graphs do not depend on the aspect
+        if len(self.aspects) == 1:
+            return tf.variable_scope(tf.get_variable_scope())
+        return tf.variable_scope('aspect{:}'.format(self.aspects[k]))
 
-        finalStates = tf.concat(concat_dim = 1, values = states)
+    def add_prediction_op(self):
+
+        # get relevent embedding data
+        x = self.add_embedding()
+        # one generator for all aspects; every aspect gets its own selection
+        # and prediction head on top of its final states
+        finalStates = self.add_generator(x)
+        if self.config.selection == 'token':
+            add_head = self.add_token_head
+        elif self.config.selection == 'span':
+            add_head = self.add_span_head
+        elif self.config.selection == 'span_lstm':
+            add_head = self.add_span_lstm_head
+        else:
+            raise ValueError("unknown selection: {:}".format(self.config.selection))
+
+        preds = [ ]
+        self.aspectZPreds = [ ]
+        self.aspectSelection = [ ]
+        for k in range(len(self.aspects)):
+            with self.head_scope(k):
+                pred, zPreds, selection = add_head(x, finalStates)
+            preds.append(pred)
+            self.aspectZPreds.append(zPreds)
+            self.aspectSelection.append(selection)
+        # the rationale of the first aspect, for save_preds
+        self.zPreds = self.aspectZPreds[0]
+        return preds
+
+    def add_token_head(self, x, finalStates):
+        '''
+        Keeps or drops every token: zPreds is a (nearly) 0/1 batchSize X
+        sentence mask, and the encoder reads the review with the dropped
+        tokens replaced by the padding word
+        :return: aspect scores (batchSize X n_class), zPreds and the
+        selection cross entropy
+        '''
+        hidden_size = self.config.hidden_size
+        n_class = self.config.n_class
+        embedding_size = self.config.embedding_size
+        stateSize = finalStates.get_shape()[1].value
 
         # Define our prediciton layer variables
         U = tf.get_variable(name='W_gen',
-                            shape=((4 * hidden_size), self.config.max_sentence),
+                            shape=(stateSize, self.config.max_sentence),
                             dtype=tf.float32,
                             initializer=tf.contrib.layers.xavier_initializer())
 
@@ -186,33 +307,37 @@ class RNNGeneratorModel(object):
                             initializer=tf.constant_initializer(0.0))
 
         # zLayer probabilities - each prob is prob of keeping word in review
-        zProbs = tf.sigmoid(tf.matmul(finalStates, U) + c)
+        # only the first batchWidth positions are used for a bucketed batch
+        batchWidth = tf.shape(self.inputPH)[1]
+        zProbs = tf.sigmoid(tf.matmul(finalStates, U[:, :batchWidth]) + c[:batchWidth])
         
-        self.zPreds = 1.0 / (1.0 + tf.exp(-60.0*(zProbs-0.5))) # sigmoid to simulate rounding
+        zPreds = 1.0 / (1.0 + tf.exp(-60.0*(zProbs-0.5))) # sigmoid to simulate rounding
 
-        self.zPreds = tf.select(self.maskPH, self.zPreds, tf.zeros(shape=tf.shape(zProbs), dtype=tf.float32))
+        zPreds = tf.select(self.maskPH, zPreds, tf.zeros(shape=tf.shape(zProbs), dtype=tf.float32))
+        zPreds = tf.identity(zPreds, name='zPreds')
         masks = tf.zeros(shape = tf.shape(zProbs), dtype = tf.int32) + self.maskId
-        maskedInputs = tf.select(tf.cast(self.zPreds, tf.bool), self.inputPH, masks)
-        crossEntropy = -1.0 * (((self.zPreds * tf.log(zProbs + 0.001)) + ((1 - self.zPreds) * tf.log(1 - zProbs + 0.001))))
-        self.crossEntropy = crossEntropy
+        maskedInputs = tf.select(tf.cast(zPreds, tf.bool), self.inputPH, masks)
+        crossEntropy = -1.0 * (((zPreds * tf.log(zProbs + 0.001)) + ((1 - zPreds) * tf.log(1 - zProbs + 0.001))))
 
         ###########
         # ENCODER #
         ###########
 
         # Return masked embeddings to pass to encoder
-        embedding_shape = (-1,
-                           self.config.max_sentence,
-                           self.config.embedding_size)
+        maskedEmbeddings = self.embedding_lookup(maskedInputs)
 
-        maskedEmbeddings = tf.nn.embedding_lookup(self.pretrained_embeddings,
-                                                  maskedInputs)
-        maskedEmbeddings = tf.cast(maskedEmbeddings, tf.float32)
-        maskedEmbeddings = tf.reshape(maskedEmbeddings, shape=embedding_shape)
+        # Create encoder cells
+        cell_multi = tf.nn.rnn_cell.MultiRNNCell([self.make_cell(embedding_size),
+                                                  self.make_cell(hidden_size)])
+        result = tf.nn.dynamic_rnn(cell_multi,
+                                   maskedEmbeddings,
+                                   dtype=tf.float32,
+                                   sequence_length=self.seqPH)
+        h_t = self.flatten_states(result[1])
 
         # Define our prediciton layer variables
         W = tf.get_variable(name='W',
-                            shape=((2 * hidden_size), n_class),
+                            shape=(h_t.get_shape()[1].value, n_class),
                             dtype=tf.float32,
                             initializer=tf.contrib.layers.xavier_initializer())
 
@@ -221,118 +346,299 @@ class RNNGeneratorModel(object):
                             dtype=tf.float32,
                             initializer=tf.constant_initializer(0.0))
 
-        # Create encoder cells
-        cell1 = tf.nn.rnn_cell.BasicRNNCell(embedding_size, activation=tf.tanh)
-        cell2 = tf.nn.rnn_cell.BasicRNNCell(hidden_size, activation=tf.tanh)
-
-        cell1_drop = tf.nn.rnn_cell.DropoutWrapper(cell1,
-                                                   output_keep_prob=self.dropoutPH)
-        cell2_drop = tf.nn.rnn_cell.DropoutWrapper(cell2,
-                                                   output_keep_prob=self.dropoutPH)
-        cell_multi = tf.nn.rnn_cell.MultiRNNCell([cell1_drop, cell2_drop])
-        result = tf.nn.dynamic_rnn(cell_multi,
-                                   maskedEmbeddings,
-                                   dtype=tf.float32,
-                                   sequence_length=self.seqPH)
-        h_t = tf.concat(concat_dim=1,
-                        values=[result[1][0], result[1][1]])
+        y_t = tf.tanh(tf.matmul(h_t, W) + b, name='scorePred')
+
+        return y_t, zPreds, crossEntropy
+
+    def add_span_head(self, x, finalStates):
+        '''
+        Selects one span of config.span_len tokens: zProbs is a softmax over
+        the batchSize X (sentence - span_len) start words, zPreds its argmax,
+        and a windowed convolution scores the span at every start
+        :return: aspect score of every start (batchSize X (sentence -
+        span_len)), zPreds and zProbs
+        '''
+        hidden_size = self.config.hidden_size
+        embedding_size = self.config.embedding_size
+        span_len = self.config.span_len
+        stateSize = finalStates.get_shape()[1].value
+
+        # Define our prediciton layer variables - less span_len to not select them
+        U = tf.get_variable(name='W_gen',
+                            shape=(stateSize, self.config.max_sentence - span_len),
+                            dtype=tf.float32,
+                            initializer=tf.contrib.layers.xavier_initializer())
+
+        c = tf.get_variable(name='b_gen',
+                            shape=(self.config.max_sentence - span_len,),
+                            dtype=tf.float32,
+                            initializer=tf.constant_initializer(0.0))
+
+        # probability of each word as the start word; a bucketed batch only
+        # has batchWidth - span_len starts
+        nStarts = tf.shape(self.inputPH)[1] - span_len
+        zProbs = tf.nn.softmax(tf.matmul(finalStates, U[:, :nStarts]) + c[:nStarts])
+
+        # we predict on the argmax of zProbs and span_len words. define zPreds
+        # return start idx for prediction
+        zPreds = tf.argmax(zProbs, axis = 1, name = 'zPreds')
+
+        # Score every candidate span with the same window: a 1-D convolution
+        # maps each span_len x embedding_size window to hidden_size features
+        # and a width-1 convolution maps those to one score per start
+        W1 = tf.get_variable(name='W1',
+                            shape=(span_len, embedding_size, hidden_size),
+                            dtype=tf.float32,
+                            initializer=tf.contrib.layers.xavier_initializer())
+        b1 = tf.get_variable(name='b1',
+                            shape=(hidden_size,),
+                            dtype=tf.float32,
+                            initializer=tf.constant_initializer(0.0))
+        W2 = tf.get_variable(name='W2',
+                            shape=(1, hidden_size, 1),
+                            dtype=tf.float32,
+                            initializer=tf.contrib.layers.xavier_initializer())
+        b2 = tf.get_variable(name='b2',
+                            shape=(1,),
+                            dtype=tf.float32,
+                            initializer=tf.constant_initializer(0.0))
+
+        # batch_size x sentence - span_len + 1 x hidden_size, keeping only
+        # the starts the generator can select
+        encoder1 = tf.tanh(tf.nn.conv1d(x, W1, stride=1, padding='VALID') + b1)
+        encoder1 = encoder1[:, :nStarts, :]
+        dropEncoder1 = tf.nn.dropout(encoder1, self.dropoutPH)
+
+        # batch_size x sentence - span_len
+        encoder2 = tf.tanh(tf.nn.conv1d(dropEncoder1, W2, stride=1, padding='VALID') + b2)
+        encoder2 = tf.identity(encoder2[:, :, 0], name='scorePred')
+
+        return encoder2, zPreds, zProbs
+
+    def add_span_lstm_head(self, x, finalStates):
+        '''
+        Selects one span of config.span_len tokens like add_span_head, but
+        scores the span at every start with a recurrent encoder (the cell
+        stack of the token head) run over its span_len words
+        :return: aspect score of every start (batchSize X (sentence -
+        span_len)), zPreds and zProbs
+        '''
+        hidden_size = self.config.hidden_size
+        embedding_size = self.config.embedding_size
+        span_len = self.config.span_len
+        stateSize = finalStates.get_shape()[1].value
+
+        # Define our prediciton layer variables - less span_len to not select them
+        U = tf.get_variable(name='W_gen',
+                            shape=(stateSize, self.config.max_sentence - span_len),
+                            dtype=tf.float32,
+                            initializer=tf.contrib.layers.xavier_initializer())
+
+        c = tf.get_variable(name='b_gen',
+                            shape=(self.config.max_sentence - span_len,),
+                            dtype=tf.float32,
+                            initializer=tf.constant_initializer(0.0))
 
+        # probability of each word as the start word; a bucketed batch only
+        # has batchWidth - span_len starts
+        currBatch = tf.shape(self.inputPH)[0]
+        nStarts = tf.shape(self.inputPH)[1] - span_len
+        zProbs = tf.nn.softmax(tf.matmul(finalStates, U[:, :nStarts]) + c[:nStarts])
+
+        # we predict on the argmax of zProbs and span_len words. define zPreds
+        # return start idx for prediction
+        zPreds = tf.argmax(zProbs, axis = 1, name = 'zPreds')
+
+        # the ids of every candidate span, one review span per row:
+        # (batch_size * (sentence - span_len)) x span_len
+        windows = tf.expand_dims(tf.range(nStarts), 1) + tf.range(span_len)
+        spanIds = tf.gather(tf.transpose(self.inputPH), windows)
+        spanIds = tf.reshape(tf.transpose(spanIds, perm=[2, 0, 1]), (-1, span_len))
+        spanEmbeddings = self.embedding_lookup(spanIds)
+
+        # one encoder run over all the spans of the batch
+        cell_multi = tf.nn.rnn_cell.MultiRNNCell([self.make_cell(embedding_size),
+                                                  self.make_cell(hidden_size)])
+        _, states = tf.nn.dynamic_rnn(cell_multi,
+                                      spanEmbeddings,
+                                      dtype=tf.float32)
+        h_t = self.flatten_states(states)
+
+        # Define our prediciton layer variables
+        W = tf.get_variable(name='W',
+                            shape=(h_t.get_shape()[1].value, 1),
+                            dtype=tf.float32,
+                            initializer=tf.contrib.layers.xavier_initializer())
+
+        b = tf.get_variable(name='b',
+                            shape=(1,),
+                            dtype=tf.float32,
+                            initializer=tf.constant_initializer(0.0))
+
+        # batch_size x sentence - span_len
         y_t = tf.tanh(tf.matmul(h_t, W) + b)
+        y_t = tf.reshape(y_t, tf.pack([currBatch, nStarts]), name='scorePred')
+
+        return y_t, zPreds, zProbs
+
+    def add_loss_op(self, preds):
+        # weighted sum of the aspect losses; the regularization is shared.
+        # The towers' losses add up to the loss of a single tower model: the
+        # token cost weighs every review by rowWeightsPH (its share of the
+        # batch mean), the span cost sums the tower's own reviews
+        weights = self.config.aspect_weights or [1.0] * len(self.aspects)
+        cost = 0.0
+        for k, pred in enumerate(preds):
+            labels = self.labelsPH[:, k:k + 1]
+            if self.selects_span():
+                aspectCost = self.span_cost(pred, labels, self.aspectSelection[k])
+            else:
+                rowCost = self.token_cost(pred, labels, self.aspectSelection[k])
+                aspectCost = tf.reduce_sum(rowCost * self.rowWeightsPH)
+            cost += weights[k] * aspectCost
+
+        # regularization
+        reg_by_var = [tf.nn.l2_loss(v) for v in tf.trainable_variables()]
+        regularization = tf.reduce_sum(reg_by_var)
+        if self.config.n_towers > 1:
+            # each tower adds its reviews' share, so the sum over the towers
+            # counts it once
+            regularization = regularization * tf.reduce_sum(self.rowWeightsPH)
 
-        return y_t
+        loss = cost + regularization * self.l2RegPH
 
-    def add_loss_op(self, pred):
-        sparsity_factor = 0.3
-        coherent_ratio = 2.0
+        return loss
+
+    def token_cost(self, pred, labels, crossEntropy):
+        sparsity_factor = self.config.sparsity_factor
+        coherent_ratio = self.config.coherent_ratio
         coherent_factor = sparsity_factor * coherent_ratio
 
-        # Compute L2 loss
-        logPz = self.crossEntropy
+        # Compute L2 loss, one per review. Padding positions are left out,
+        # so a review's cost does not depend on the width of its bucket
+        logPz = tf.select(self.maskPH, crossEntropy, tf.zeros_like(crossEntropy))
         logPzSum = tf.reduce_sum(logPz, axis=1)
-        predDiff = tf.square(self.labelsPH - pred)
+        predDiff = tf.square(labels - pred)[:, 0]
 
-        # coherance and sparsity regularization
+        # coherance and sparsity regularization; only pairs of neighbouring
+        # words count towards the coherence
         Zsum = tf.reduce_sum(logPz, axis=1)
-        Zdiff = tf.reduce_sum(tf.abs(logPz[:,1:] - logPz[:,:-1]), axis=1)
+        pairs = tf.logical_and(self.maskPH[:,1:], self.maskPH[:,:-1])
+        Zdiff = tf.reduce_sum(tf.abs(logPz[:,1:] - logPz[:,:-1]) * tf.cast(pairs, tf.float32), axis=1)
 
         costVec = predDiff + Zsum * sparsity_factor + Zdiff * coherent_factor
-        costLogPz = tf.reduce_mean(costVec * logPzSum)
+        costLogPz = costVec * logPzSum
 
-        # regularization
-        reg_by_var = [tf.nn.l2_loss(v) for v in tf.trainable_variables()]
-        regularization = tf.reduce_sum(reg_by_var)
+        return 10.0 * costLogPz
 
-        loss = 10.0 * costLogPz + regularization * self.l2RegPH
+    def span_cost(self, pred, labels, zProbs):
 
-        return loss
+        span_len = self.config.span_len
+
+        # pred will batch_size x (sentence - span_len)
+        # compute expected squared cost
+        predDiff = pred - labels
+        predDiffSqr = predDiff * predDiff
+        expCost = zProbs * predDiffSqr
+
+        # mask if even one word in span has a padding word, and the reviews
+        # repeated to fill the towers of a short batch
+        mask = self.maskPH[:,span_len:]
+        if self.config.n_towers > 1:
+            rowKept = tf.expand_dims(self.rowWeightsPH > 0, 1)
+            mask = tf.logical_and(mask, rowKept)
+        maskedCost = tf.boolean_mask(expCost, mask)
+
+        # summed over the batch
+        return tf.reduce_sum(maskedCost)
 
-    def add_training_op(self, loss):
+    def add_training_op(self, losses):
         opt = tf.train.AdamOptimizer(learning_rate=self.config.lr)
-        grads = opt.compute_gradients(loss)
+        # the gradients of the towers are summed before the single update
+        grads = self.sum_gradients([opt.compute_gradients(loss) for loss in losses])
         self.grad_print = [(grad, var) for grad, var in grads]
         capped_grads = [(tf.clip_by_value(grad, -1., 1.), var) for grad, var in
                         grads]
         train_op = opt.apply_gradients(capped_grads)
         return train_op
 
+    def sum_gradients(self, tower_grads):
+        '''
+        :param tower_grads: the compute_gradients list of every tower; each
+        tower's loss is its share of the batch loss (see add_loss_op)
+        :return: one (summed gradient, variable) pair per variable
+        '''
+        if len(tower_grads) == 1:
+            return tower_grads[0]
+        grads = [ ]
+        for grad_and_vars in zip(*tower_grads):
+            var = grad_and_vars[0][1]
+            tower_grad = [ g for g, _ in grad_and_vars if g is not None ]
+            if not tower_grad:
+                grads.append((None, var))
+                continue
+            grads.append((tf.add_n(tower_grad), var))
+        return grads
+
     ## TODO: Add def evaluate(test_set)
-    def evaluate(self, pred):
-        diff = self.labelsPH - pred
-        prod = tf.matmul(diff, diff, transpose_a=True)
-        se = tf.reduce_sum(prod)
-        return se
+    def evaluate(self, preds):
+        # squared error of every aspect, a vector of len(aspects); the
+        # reviews repeated to fill the towers (zero weight) do not count
+        rowMask = tf.expand_dims(tf.cast(self.rowWeightsPH > 0, tf.float32), 1)
+        se = [ ]
+        for k, pred in enumerate(preds):
+            diff = self.labelsPH[:, k:k + 1] - pred
+            if self.selects_span():
+                # expected squared error over the start words
+                se.append(tf.reduce_sum(diff * diff * self.aspectSelection[k] * rowMask))
+            else:
+                se.append(tf.reduce_sum(diff * diff * rowMask))
+        return tf.pack(se)
+
+    def eval_dropout(self):
+        # the in-training evaluation keeps the training dropout; the
+        # out-of-band evaluator sets inference_mode
+        return 1.0 if self.inference_mode else self.config.drop_out
 
     def evaluate_on_batch(self, sess, inputs_batch, labels_batch, mask_batch, sentLen):
         feed = self.create_feed_dict(inputs_batch = inputs_batch,
                                      mask_batch = mask_batch,
                                      seqLen = sentLen,
                                      labels_batch=labels_batch,
-                                     dropout=self.config.drop_out,
+                                     dropout=self.eval_dropout(),
                                      l2_reg=self.config.l2Reg)
         se = sess.run(self.eval, feed_dict=feed)
         return se
 
-    def get_batch_precision(self):
-        zPreds = self.zPreds
-        overlap = zPreds * self.rationalsPH
-        predCorrect = tf.reduce_sum(overlap)
-        predTotal = tf.reduce_sum(zPreds)
-        return predCorrect, predTotal
-
-    def run_rationals(self, sess, inputs_batch, labels_batch, mask_batch, sentLen, rationals):
+    def run_test_batch(self, sess, inputs_batch, labels_batch, mask_batch, sentLen):
+        # squared errors and the rationale of every aspect from a single
+        # forward pass
         feed = self.create_feed_dict(inputs_batch = inputs_batch,
                                      mask_batch = mask_batch,
                                      seqLen=sentLen,
                                      labels_batch=labels_batch,
-                                     dropout=self.config.drop_out,
-                                     l2_reg=self.config.l2Reg,
-                                     rationals=rationals)
-        predCorrect, predTotal = sess.run([self.predCorrect, self.predTotal], feed_dict = feed)
-        return predCorrect, predTotal
-
-    def run_test_batch(self, sess, inputs_batch, labels_batch, mask_batch, sentLen, rationals):
-        predCorrect, predTotal = self.run_rationals(sess,
-                                                    inputs_batch,
-                                                    labels_batch,
-                                                    mask_batch,
-                                                    sentLen,
-                                                    rationals)
-        se = self.evaluate_on_batch(sess,
-                                    inputs_batch,
-                                    labels_batch,
-                                    mask_batch,
-                                    sentLen)
-
-        return se, predCorrect, predTotal
+                                     dropout=self.eval_dropout(),
+                                     l2_reg=self.config.l2Reg)
+        results = sess.run([self.eval] + self.aspectZPreds, feed_dict=feed)
+
+        return results[0], results[1:]
 
     def train_on_batch(self, sess, inputs_batch, labels_batch, mask_batch, sentLen):
-        feed = self.create_feed_dict(inputs_batch = inputs_batch,
-                                     mask_batch = mask_batch,
-                                     seqLen=sentLen,
-                                     labels_batch=labels_batch,
-                                     dropout=self.config.drop_out,
-                                     l2_reg=self.config.l2Reg)
-        _, loss, grad_print = sess.run([self.train_op, self.loss, self.grad_print], feed_dict=feed)
+        feed = self.create_tower_feed_dict(inputs_batch = inputs_batch,
+                                           mask_batch = mask_batch,
+                                           seqLen=sentLen,
+                                           labels_batch=labels_batch,
+                                           dropout=self.config.drop_out,
+                                           l2_reg=self.config.l2Reg)
+        # update, loss and squared error from a single forward pass of every
+        # tower
+        n_towers = len(self.towers)
+        results = sess.run([self.train_op] +
+                           [ tower['loss'] for tower in self.towers ] +
+                           [ tower['eval'] for tower in self.towers ], feed_dict=feed)
+        # the tower losses are shares of the batch loss
+        loss = np.sum(results[1:1 + n_towers])
+        se = np.sum(results[1 + n_towers:], axis=0)
         #for grad in grad_print:
         #     print ''
         #     print 'grad, var (shape, norm):'
@@ -340,20 +646,21 @@ class RNNGeneratorModel(object):
         #     print grad[1].shape
         #     print np.linalg.norm(grad[0])
         #     print np.linalg.norm(grad[1])
-        return loss
+        return loss, se
 
     def save_preds(self, sess, outFile):
-        for i, (test_x, test_y, test_sentLen, test_mask, test_rat) in enumerate(
-            get_minibatches_test(self.test_x, self.test_y, self.test_sentLen,
-                                 self.test_mask, self.rationals,
-                                 self.config.batch_size, False)):
+        for i, (test_x, test_y, test_sentLen, test_mask) in enumerate(
+            get_ragged_minibatches(self.test_x, self.test_y, self.maskId,
+                                   self.config.batch_size,
+                                   width=self.config.max_sentence,
+                                   shuffle=False)):
             feed = self.create_feed_dict(inputs_batch=test_x,
                                          mask_batch=test_mask,
                                          seqLen=test_sentLen,
                                          labels_batch=test_y,
                                          dropout=self.config.drop_out,
-                                         l2_reg=self.config.l2Reg,
-                                         rationals=test_rat)
+                                         l2_reg=self.config.l2Reg)
+            # a 0/1 row per review, or its span start for the span head
             preds = sess.run(self.zPreds, feed_dict = feed)
             preds = np.round(preds, 0)
             preds = preds.astype(int)
@@ -361,121 +668,452 @@ class RNNGeneratorModel(object):
             np.savetxt(f, preds, delimiter=' ')
             f.close()
 
+    def export_inference_graph(self, sess, path, rewrite=None):
+        '''
+        Writes a frozen inference graph to @path for FrozenGenerator. Only the
+        ops between the input, mask, sequenceLen and dropout placeholders and
+        the zPreds / scorePred outputs are kept (no loss or optimizer), with
+        the variables, embeddings included, folded into constants. The
+        vocabulary and batch metadata are written next to it.
+        :param rewrite: function applied to the frozen GraphDef before it is
+        written (e.g. quantize_generator.quantize_graph_def)
+        '''
+        # the outputs of a multi-aspect model are scoped by aspect
+        outputs = [ ]
+        for k in range(len(self.aspects)):
+            prefix = '' if len(self.aspects) == 1 else 'aspect{:}/'.format(self.aspects[k])
+            outputs += [prefix + 'zPreds', prefix + 'scorePred']
+        graph_def = graph_util.convert_variables_to_constants(
+            sess, sess.graph.as_graph_def(), outputs)
+        if rewrite is not None:
+            graph_def = rewrite(graph_def)
+        with tf.gfile.GFile(path, 'wb') as f:
+            f.write(graph_def.SerializeToString())
+        myio_save_vocab(self.vocab, path)
+        myio_save_checkpoint_meta({'max_sentence': self.config.max_sentence,
+                                   'length_policy': self.config.length_policy,
+                                   'mask_id': self.maskId,
+                                   'aspect': self.aspect,
+                                   'aspects': self.aspects,
+                                   'selection': self.config.selection,
+                                   'span_len': self.config.span_len}, path)
+        print "Inference graph ({:} nodes) exported to {:}".format(len(graph_def.node), path)
+
+    def format_mse(self, mse):
+        # one number for a single aspect, else the mean and each aspect
+        if len(self.aspects) == 1:
+            return '{0}'.format(mse[0])
+        return '{0} ({1})'.format(np.mean(mse), ', '.join(
+            'aspect {0}: {1:.5f}'.format(aspect, m) for aspect, m in zip(self.aspects, mse)))
+
     def run_epoch(self, sess):
-        train_se = 0.0
-        prog = Progbar(target=1 + self.train_x.shape[0] / self.config.batch_size)
-        for i, (train_x, train_y, train_sentLen, mask) in enumerate(minibatches(self.train_x, self.train_y, self.train_sentLen, self.train_mask, self.config.batch_size)):
-            loss = self.train_on_batch(sess, train_x, train_y, mask, train_sentLen)
-            train_se += self.evaluate_on_batch(sess, train_x, train_y, mask, train_sentLen)
-            prog.update(i + 1, [("train loss", loss)])
-
-        train_obs = self.train_x.shape[0]
-        train_mse = train_se / train_obs
+        start = time.time()
+        train_se = np.zeros(len(self.aspects))
+        train_obs = 0
+        cursor = 0
+        if self.resume_state is not None:
+            # resuming inside an epoch: rewind the RNG to the start of the
+            # epoch, so its batches come in the same order, and skip the
+            # batches already trained on
+            np.random.set_state(self.resume_state['epoch_rng'])
+            cursor = self.resume_state['cursor']
+            train_se = np.array(self.resume_state['train_se'])
+            train_obs = self.resume_state['train_obs']
+            self.resume_state = None
+        epoch_rng = np.random.get_state()
+        if self.config.stream_train:
+            prog = Progbar(target=1 + len(self.train_x) / self.config.batch_size)
+            train_batches = self.train_x.minibatches(self.config.batch_size,
+                                                     self.maskId,
+                                                     max_width=self.config.max_sentence,
+                                                     aspect=self.aspects)
+            train_batches = itertools.islice(train_batches, cursor, None)
+        else:
+            bucket_batches = get_bucket_batches(self.train_x.lengths, self.config.batch_size, self.buckets)
+            prog = Progbar(target=len(bucket_batches))
+            train_batches = get_bucketed_minibatches(self.train_x, self.train_y, self.maskId, bucket_batches[cursor:])
+        train_batches = BatchPrefetcher(train_batches, self.config.prefetch_batches)
+        for i, (train_x, train_y, train_sentLen, mask) in enumerate(train_batches, cursor):
+            loss, se = self.train_on_batch(sess, train_x, train_y, mask, train_sentLen)
+            train_se += se
+            train_obs += train_x.shape[0]
+            self.step += 1
+            prog.update(i + 1, [("train loss", loss), ("queue depth", train_batches.depth)])
+            if self.checkpoint_due():
+                self.save_checkpoint(sess, epoch_rng, i + 1, train_se, train_obs)
 
-        print 'Training MSE is {0}'.format(train_mse)
+        train_mse = train_se / train_obs
 
+        print 'Training MSE is {0}'.format(self.format_mse(train_mse))
+        if not self.config.evaluate_in_training:
+            # generator_evaluator.py scores the checkpoints instead
+            self.history.append({'epoch': len(self.history) + 1,
+                                 'train_mse': train_mse.tolist(),
+                                 'seconds': time.time() - start})
+            return None
+
+        dev_mse = self.run_dev(sess)
+        test_mse, test_precision = self.run_test(sess)
+        print '- test MSE: {0}'.format(self.format_mse(test_mse))
+        self.history.append({'epoch': len(self.history) + 1,
+                             'train_mse': train_mse.tolist(),
+                             'dev_mse': dev_mse.tolist(),
+                             'test_mse': test_mse.tolist(),
+                             'test_precision': test_precision,
+                             'seconds': time.time() - start})
+        # the checkpoint is picked on the mean over the aspects
+        return np.mean(dev_mse)
+
+    def run_dev(self, sess):
+        '''
+        :return: dev MSE of every aspect
+        '''
         print "Evaluating on dev set",
-        dev_se = 0.0
-        for i, (dev_x, dev_y, dev_sentLen, dev_mask) in enumerate(minibatches(self.dev_x, self.dev_y, self.dev_sentLen, self.dev_mask, self.config.batch_size)):
+        dev_se = np.zeros(len(self.aspects))
+        for i, (dev_x, dev_y, dev_sentLen, dev_mask) in enumerate(get_bucketed_minibatches(self.dev_x, self.dev_y, self.maskId, get_bucket_batches(self.dev_x.lengths, self.config.batch_size, self.buckets, shuffle=False))):
             dev_se += self.evaluate_on_batch(sess, dev_x, dev_y, dev_mask, dev_sentLen)
 
-        dev_obs = self.dev_x.shape[0]
+        dev_obs = len(self.dev_x)
         dev_mse = dev_se / dev_obs
 
-        print "- dev MSE: {0}".format(dev_mse)
+        print "- dev MSE: {0}".format(self.format_mse(dev_mse))
+        return dev_mse
 
+    def run_test(self, sess):
+        '''
+        Scores the test set and prints the rationale precision of every
+        aspect: per token for the token head, per span length for the span
+        head
+        :return: test MSE and rationale precision (None without
+        annotations) of every aspect
+        '''
         print 'Evaluating on test set'
-        test_se = 0.0
-        test_correct = 0
-        test_totalPred = 0
-        for i, (test_x, test_y, test_sentLen, test_mask, test_rat) in enumerate(get_minibatches_test(self.test_x, self.test_y, self.test_sentLen, self.test_mask, self.rationals, self.config.batch_size, False)):
-            se, predCorrect, predTotal = self.run_test_batch(sess, test_x, test_y, test_mask, test_sentLen, test_rat)
+        n_aspects = len(self.aspects)
+        test_batches = get_bucket_batches(self.test_x.lengths, self.config.batch_size, self.buckets, shuffle=False)
+        test_se = np.zeros(n_aspects)
+        test_correct = np.zeros(n_aspects)
+        test_totalPred = np.zeros(n_aspects)
+        test_starts = [ [ ] for _ in range(n_aspects) ]
+        test_minibatches = get_bucketed_minibatches(self.test_x, self.test_y, self.maskId, test_batches)
+        for (indices, width), (test_x, test_y, test_sentLen, test_mask) in zip(test_batches, test_minibatches):
+            se, zPreds = self.run_test_batch(sess, test_x, test_y, test_mask, test_sentLen)
             test_se += se
-            test_correct += predCorrect
-            test_totalPred += predTotal
-        precision = float(predCorrect) / float(predTotal)
-
-        test_obs = self.test_x.shape[0]
-        test_mse = test_se / test_obs
-
-        print '- test MSE: {0}'.format(test_mse)
-        print '- test precision: {0}'.format(precision)
-        print '- test predictions count: {0}'.format(test_totalPred)
-        return dev_mse
+            for k, z in enumerate(zPreds):
+                if self.selects_span():
+                    test_starts[k].append(z)
+                else:
+                    test_correct[k] += np.sum(z * self.rationals[k][indices, :width])
+                    test_totalPred[k] += np.sum(z)
+
+        # batches come in bucket order, so each span start is matched to its
+        # rationale row
+        rows = np.concatenate([indices for indices, _ in test_batches])
+        span_lens = sorted(set(self.config.eval_span_lens) | set([self.config.span_len]))
+        precisions = [ ]
+        for k, aspect in enumerate(self.aspects):
+            tag = '' if n_aspects == 1 else ' (aspect {0})'.format(aspect)
+            if not self.rationals[k].any():
+                print '- test precision{0}: no rationale annotations'.format(tag)
+                precisions.append(None)
+                continue
+            if self.selects_span():
+                span_scores = span_precision_recall(self.rationalPrefix[k],
+                                                    np.concatenate(test_starts[k]),
+                                                    span_lens, rows=rows)
+                _, predTotal, precision, _ = span_scores[self.config.span_len]
+            else:
+                predTotal = test_totalPred[k]
+                precision = test_correct[k] / max(predTotal, 1.0)
+            precisions.append(float(precision))
+
+            print '- test precision{0}: {1}'.format(tag, precision)
+            print '- test predictions count{0}: {1}'.format(tag, predTotal)
+            if self.selects_span():
+                for span_len in span_lens:
+                    _, _, span_precision, span_recall = span_scores[span_len]
+                    print '- test span {0}{1}: precision {2}, recall {3}'.format(span_len, tag, span_precision, span_recall)
+
+        test_obs = len(self.test_x)
+        return test_se / test_obs, precisions
+
+    def checkpoint_due(self):
+        if self.checkpoint_writer is None:
+            return False
+        every_steps = self.config.checkpoint_every_steps
+        every_minutes = self.config.checkpoint_every_minutes
+        last_step, last_time = self.last_checkpoint
+        return bool((every_steps and self.step - last_step >= every_steps) or
+                    (every_minutes and time.time() - last_time >= 60.0 * every_minutes))
+
+    def save_checkpoint(self, sess, epoch_rng, cursor, train_se, train_obs):
+        '''
+        Queues a full training checkpoint to config.checkpoint_path: the
+        model and Adam variables, the epoch and step counters, the RNG state
+        at the start of the epoch and the number of its batches done
+        (@cursor), so restore_checkpoint can replay the rest of the epoch.
+        Training waits only while the variables are fetched
+        '''
+        if not self.checkpoint_meta_saved:
+            # the vocabulary and model description, for generator_evaluator.py
+            myio_save_vocab(self.vocab, self.config.checkpoint_path)
+            myio_save_checkpoint_meta(self.model_meta(), self.config.checkpoint_path)
+            self.checkpoint_meta_saved = True
+        values = sess.run(self.checkpoint_vars)
+        arrays = dict(('var{:}'.format(k), value) for k, value in enumerate(values))
+        arrays['epoch_rng'] = epoch_rng[1]
+        state = {'variables': [ var.op.name for var in self.checkpoint_vars ],
+                 'model': self.model_meta(),
+                 'epoch': self.epoch,
+                 'step': self.step,
+                 'cursor': cursor,
+                 'epoch_rng': [epoch_rng[0], epoch_rng[2], epoch_rng[3], epoch_rng[4]],
+                 'train_se': list(train_se),
+                 'train_obs': train_obs,
+                 'best_dev_mse': self.best_dev_mse,
+                 'history': self.history}
+        self.checkpoint_writer.save(arrays, state)
+        self.last_checkpoint = (self.step, time.time())
+
+    def load_checkpoint_variables(self, sess, arrays, state, path):
+        '''
+        Assigns the variables of a checkpoint read by load_checkpoint
+        '''
+        variables = dict((var.op.name, var) for var in self.checkpoint_vars)
+        if set(state['variables']) != set(variables):
+            raise ValueError("{:} was written by a different model".format(path))
+        if self.loadOps is None:
+            self.loadOps = { }
+            for name, var in variables.items():
+                valuePH = tf.placeholder(dtype=var.dtype.base_dtype, shape=var.get_shape())
+                self.loadOps[name] = (tf.assign(var, valuePH), valuePH)
+        assigns = [ ]
+        feed = { }
+        for k, name in enumerate(state['variables']):
+            assign, valuePH = self.loadOps[name]
+            assigns.append(assign)
+            feed[valuePH] = arrays['var{:}'.format(k)]
+        sess.run(assigns, feed_dict=feed)
+
+    def restore_checkpoint(self, sess):
+        '''
+        Loads the checkpoint at config.checkpoint_path written by
+        save_checkpoint; fit then continues from where it was taken
+        :return: False if there is no checkpoint
+        '''
+        path = self.config.checkpoint_path
+        arrays, state = load_checkpoint(path)
+        if state is None:
+            print "No checkpoint at {:}, starting from scratch".format(path)
+            return False
+        self.load_checkpoint_variables(sess, arrays, state, path)
+
+        self.epoch = state['epoch']
+        self.step = state['step']
+        self.best_dev_mse = state['best_dev_mse']
+        self.history = state['history']
+        rng = state['epoch_rng']
+        self.resume_state = {'epoch_rng': (rng[0], arrays['epoch_rng'], rng[1], rng[2], rng[3]),
+                             'cursor': state['cursor'],
+                             'train_se': state['train_se'],
+                             'train_obs': state['train_obs']}
+        self.last_checkpoint = (self.step, time.time())
+        print "Resumed from {:} at epoch {:}, step {:}".format(path, self.epoch + 1, self.step)
+        return True
+
+    def model_meta(self):
+        # what load_model_rationales.py and generator_evaluator.py need to
+        # rebuild this graph
+        return {'max_sentence': self.config.max_sentence,
+                'length_policy': self.config.length_policy,
+                'cell_type': self.config.cell_type,
+                'n_layers': self.config.n_layers,
+                'hidden_size': self.config.hidden_size,
+                'selection': self.config.selection,
+                'span_len': self.config.span_len,
+                'aspects': self.aspects,
+                # the data the vocabulary was built from (and pruned to)
+                'data_paths': self.data_paths,
+                'stream_train': self.config.stream_train}
+
+    def save_weights(self, sess, saver, weights_path):
+        # saver.save(sess, './encoder.weights', write_meta_graph = False)
+        saver.save(sess, weights_path)
+        myio_save_vocab(self.vocab, weights_path)
+        myio_save_checkpoint_meta(self.model_meta(), weights_path)
 
     def fit(self, sess, saver):
-        best_dev_mse = np.inf
-        for epoch in range(self.config.epochs):
-            print "Epoch {:} out of {:}".format(epoch + 1, self.config.epochs)
+        weights_path = self.config.weights_path
+        try:
+            self.fit_epochs(sess, saver, weights_path)
+        finally:
+            if self.checkpoint_writer is not None:
+                self.checkpoint_writer.wait()
+        return self.best_dev_mse
+
+    def fit_epochs(self, sess, saver, weights_path):
+        while self.epoch < self.config.epochs:
+            print "Epoch {:} out of {:}".format(self.epoch + 1, self.config.epochs)
             dev_mse = self.run_epoch(sess)
-            if dev_mse < best_dev_mse:
-                best_dev_mse = dev_mse
+            self.epoch += 1
+            if dev_mse is not None and dev_mse < self.best_dev_mse:
+                self.best_dev_mse = dev_mse
                 if saver:
-                    print "New best dev MSE! Saving model in ./generator.weights"
-                    # saver.save(sess, './encoder.weights', write_meta_graph = False)
-                    saver.save(sess, './generator.weights')
+                    print "New best dev MSE! Saving model in {:}".format(weights_path)
+                    self.save_weights(sess, saver, weights_path)
+            if self.checkpoint_writer is not None:
+                self.save_checkpoint(sess, np.random.get_state(), 0,
+                                     np.zeros(len(self.aspects)), 0)
             print
 
-    def __init__(self, config, embedding_path, train_path, dev_path, test_path, rationals, aspect = 0):
-        train_x_pad, train_y, train_mask, train_sentLen, dev_x_pad, dev_y, dev_mask, dev_sentLen, embedding_pad, test_x_pad, test_y, test_mask, test_sentLen= self._read_data(
-            train_path, dev_path, test_path, embedding_path)
-        train_y = train_y[:, aspect]
-        dev_y = dev_y[:, aspect]
-        test_y = test_y[:, aspect]
-        train_y = train_y.reshape(train_y.shape[0], 1)
-        dev_y = dev_y.reshape(dev_y.shape[0], 1)
-        test_y = test_y.reshape(test_y.shape[0], 1)
-
-        train_x_pad = train_x_pad[:,0:300]
-        train_mask = train_mask[:,0:300]
-        dev_x_pad = dev_x_pad[:,0:300]
-        dev_mask = dev_mask[:,0:300]
-        test_x_pad = test_x_pad[:,0:300]
-        test_mask = test_mask[:,0:300]
-
-        for i in xrange(len(train_sentLen)):
-            if train_sentLen[i] > 300:
-                train_sentLen[i] = 300
-        for i in xrange(len(dev_sentLen)):
-            if dev_sentLen[i] > 300:
-                dev_sentLen[i] = 300
-        for i in xrange(len(test_sentLen)):
-            if test_sentLen[i] > 300:
-                test_sentLen[i] = 300
-
-        self.train_x = train_x_pad
+    def __init__(self, config, embedding_path, train_path, dev_path, test_path, rationals, aspect = 0,
+                 data = None):
+        '''
+        :param data: the tuple returned by load_data; when given, the paths
+        are not read and several models (one per graph) share the same arrays
+        '''
+        self.config = config
+        # recorded in the checkpoint metadata, so the evaluator can rebuild
+        # the model on the same data
+        self.data_paths = {'embedding': embedding_path,
+                           'train': train_path,
+                           'dev': dev_path,
+                           'test': test_path,
+                           'annotations': rationals}
+        # metrics of every epoch run by fit
+        self.history = [ ]
+        # training progress, saved and restored with the checkpoints
+        self.epoch = 0
+        self.step = 0
+        self.best_dev_mse = np.inf
+        self.resume_state = None
+        self.last_checkpoint = (0, time.time())
+        self.checkpoint_writer = None
+        self.checkpoint_meta_saved = False
+        if config.checkpoint_path:
+            self.checkpoint_writer = AsyncCheckpointWriter(config.checkpoint_path)
+        elif not config.evaluate_in_training:
+            raise ValueError("evaluate_in_training=False needs a checkpoint_path to evaluate")
+        # full dropout keep probability at evaluation (set by the evaluator)
+        self.inference_mode = False
+        # variable assignments built by load_checkpoint_variables
+        self.loadOps = None
+        # config.aspects trains the heads of several aspects at once
+        self.aspects = list(config.aspects) if config.aspects else [aspect]
+        self.aspect = self.aspects[0]
+        if config.aspect_weights and len(config.aspect_weights) != len(self.aspects):
+            raise ValueError("aspect_weights needs one weight per aspect in {:}".format(self.aspects))
+        if data is None:
+            data = load_data(config, embedding_path, train_path, dev_path, test_path, rationals)
+        train_x, train_y, dev_x, dev_y, embedding_pad, test_x, test_y, vocab, rations = data
+        if train_y is not None:
+            train_y = train_y[:, self.aspects]
+        dev_y = dev_y[:, self.aspects]
+        test_y = test_y[:, self.aspects]
+
+        # reviews stay ragged; each minibatch is padded and truncated to
+        # max_sentence tokens when it is drawn
+        self.train_x = train_x
         self.train_y = train_y
-        self.train_mask = train_mask
-        self.train_sentLen = train_sentLen
-        self.dev_x = dev_x_pad
+        self.dev_x = dev_x
         self.dev_y = dev_y
-        self.dev_mask = dev_mask
-        self.dev_sentLen = dev_sentLen
         self.pretrained_embeddings = embedding_pad
+        self.vocab = vocab
         self.maskId = len(embedding_pad) - 1
         # Update our config with data parameters
-        self.config = config
-        self.config.max_sentence = max(train_x_pad.shape[1], dev_x_pad.shape[1])
-        # self.config.max_sentence = train_x_pad.shape[1]
-        self.config.n_class = train_y.shape[1]
+        # reviews are truncated at batch time to the length picked by the
+        # length policy, and batches are padded only to the length bucket of
+        # their reviews; a streamed training set is not in memory, so dev
+        # lengths are used
+        lengths = dev_x.lengths if self.config.stream_train else train_x.lengths
+        self.config.max_sentence, self.buckets = apply_length_policy(
+            lengths, self.config.length_policy, self.config.n_buckets,
+            self.config.length_percentile, self.config.length_cap,
+            self.config.bucket_caps)
+        if self.selects_span():
+            # a batch needs at least one start word
+            min_width = self.config.span_len + 1
+            self.config.max_sentence = max(self.config.max_sentence, min_width)
+            self.buckets = sorted(set(max(b, min_width) for b in self.buckets))
+        # every aspect head predicts one score
+        self.config.n_class = 1
         self.config.embedding_size = embedding_pad.shape[1]
-        # get rationals
-        ration = self._get_rationals(rationals)
-
-        ration = ration[:,0:300]
-
-        maxPadding = train_x_pad.shape[1]
-        rationalDiff = maxPadding - ration.shape[1]
-        rationalPad = np.zeros(shape = (ration.shape[0], rationalDiff),
-                               dtype = np.int32)
-        paddedRational = np.append(ration, rationalPad, axis = 1)
-        self.rationals = paddedRational
-        self.test_x = test_x_pad
+
+        self.rationals = [ ]
+        self.rationalPrefix = [ ]
+        for aspect in self.aspects:
+            ration = rations[aspect][:,0:self.config.max_sentence]
+
+            maxPadding = self.config.max_sentence
+            rationalDiff = maxPadding - ration.shape[1]
+            rationalPad = np.zeros(shape = (ration.shape[0], rationalDiff),
+                                   dtype = np.int32)
+            paddedRational = np.append(ration, rationalPad, axis = 1)
+            self.rationals.append(paddedRational)
+            self.rationalPrefix.append(rationale_prefix_sums(paddedRational))
+        self.test_x = test_x
         self.test_y = test_y
-        self.test_mask = test_mask
-        self.test_sentLen = test_sentLen
         self.build()
 
+def load_data(config, embedding_path, train_path, dev_path, test_path, rationals):
+    '''
+    Reads the reviews, embeddings and test rationales once; pass the result
+    as @data to build several RNNGeneratorModels over the same arrays (see
+    generator_variants.py). Cached corpora stay memory-mapped
+    :return: readOurData's train_x, train_y, dev_x, dev_y, embedding_pad,
+    test_x, test_y and vocabulary, then the rationale matrix of every aspect
+    '''
+    train_x, train_y, dev_x, dev_y, embedding_pad, test_x, test_y, vocab = readOurData(
+        train_path, dev_path, test_path, embedding_path,
+        stream_train=config.stream_train,
+        shuffle_window=config.shuffle_window,
+        embedding_dtype=config.embedding_dtype)
+    rations = read_rationales_as_arrays(rationals, range(test_y.shape[1]))
+    return train_x, train_y, dev_x, dev_y, embedding_pad, test_x, test_y, vocab, rations
+
+def save_data(data, path):
+    '''
+    Writes a load_data tuple to the directory @path as .npy files, so other
+    processes (e.g. the trials of generator_sweep.py) memory-map it with
+    load_saved_data instead of reading and preprocessing the corpora again
+    '''
+    train_x, train_y, dev_x, dev_y, embedding_pad, test_x, test_y, vocab, rations = data
+    if train_y is None:
+        raise ValueError("a streamed training set can not be saved")
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    arrays = [('train_ids', train_x.values), ('train_offsets', train_x.offsets),
+              ('train_y', train_y),
+              ('dev_ids', dev_x.values), ('dev_offsets', dev_x.offsets),
+              ('dev_y', dev_y),
+              ('test_ids', test_x.values), ('test_offsets', test_x.offsets),
+              ('test_y', test_y),
+              ('embeddings', embedding_pad)]
+    arrays += [ ('rationales{:}'.format(k), ration) for k, ration in enumerate(rations) ]
+    for name, array in arrays:
+        np.save(os.path.join(path, name + '.npy'), array)
+    myio_save_checkpoint_meta({'n_rationales': len(rations)}, os.path.join(path, 'data'))
+    # the vocabulary is written last; its presence marks a complete copy
+    myio_save_vocab(vocab, os.path.join(path, 'data'))
+
+def has_saved_data(path):
+    return os.path.exists(os.path.join(path, 'data.vocab.txt'))
+
+def load_saved_data(path):
+    '''
+    Memory-maps the load_data tuple written by save_data to @path; the
+    processes reading it share one copy in the page cache
+    '''
+    def load(name):
+        return np.load(os.path.join(path, name + '.npy'), mmap_mode='r')
+    meta = myio_load_checkpoint_meta(os.path.join(path, 'data'))
+    vocab = myio_load_vocab(os.path.join(path, 'data'))
+    rations = [ load('rationales{:}'.format(k)) for k in range(meta['n_rationales']) ]
+    return (RaggedArray(load('train_ids'), load('train_offsets')), load('train_y'),
+            RaggedArray(load('dev_ids'), load('dev_offsets')), load('dev_y'),
+            load('embeddings'),
+            RaggedArray(load('test_ids'), load('test_offsets')), load('test_y'),
+            vocab, rations)
+
 '''
 Read in Data
 '''
@@ -492,16 +1130,27 @@ annotations = '/home/neuron/beer/annotations.json'
 #test = '/Users/henryneeb/CS224N-Project/source/rcnn-master/beer/annotations.txt.gz'
 #annotations = '/Users/henryneeb/CS224N-Project/source/rcnn-master/beer/annotations.json'
 
-def main(debug=False):
+def main(config=None):
+    argparser = argparse.ArgumentParser(description="Train the rationale generator")
+    argparser.add_argument("--resume", action="store_true",
+                           help="continue from the checkpoint at config.checkpoint_path")
+    args = argparser.parse_args()
+
     print 80 * "="
     print "INITIALIZING"
     print 80 * "="
-    config = Config()
+    if config is None:
+        config = Config()
 
     with tf.Graph().as_default():
         print "Building model...",
         start = time.time()
-        generatorModel = RNNGeneratorModel(config, embedding, train, dev, test, annotations)
+        generatorModel = RNNGeneratorModel(config,
+                                           config.embedding_path or embedding,
+                                           config.train_path or train,
+                                           config.dev_path or dev,
+                                           config.test_path or test,
+                                           config.annotations_path or annotations)
         print "took {:.2f} seconds\n".format(time.time() - start)
 
         init = tf.global_variables_initializer()
@@ -509,12 +1158,22 @@ def main(debug=False):
 
         with tf.Session() as session:
             session.run(init)
+            generatorModel.init_embeddings(session)
+            if args.resume:
+                generatorModel.restore_checkpoint(session)
 
             print 80 * "="
             print "TRAINING"
             print 80 * "="
 
             generatorModel.fit(session, saver)
+            if not config.evaluate_in_training:
+                print "Best weights are picked by generator_evaluator.py into {:}".format(config.weights_path)
+                return
+
+            # export the best weights for batch scoring (see FrozenGenerator)
+            saver.restore(session, config.weights_path)
+            generatorModel.export_inference_graph(session, os.path.splitext(config.weights_path)[0] + '.pb')
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+from config import Config
+from generator import RNNGeneratorModel
+from preprocess import myio_load_vocab, myio_load_checkpoint_meta
+from utils.general_utils import load_checkpoint
+
+'''
+Out-of-band evaluation: trains with Config.evaluate_in_training = False and
+scores the checkpoints in a separate process, so training never stops for
+the dev and test sets. The evaluator watches the checkpoint written by
+RNNGeneratorModel.fit, scores every new one with dropout off, appends its
+metrics to <checkpoint>.eval.jsonl, and saves the best one (by mean dev
+MSE) as the weights that load_model_rationales.py exports, with a pointer
+file <weights>.best.json naming the checkpoint they came from.
+
+    python generator.py                # with evaluate_in_training = False
+    python generator_evaluator.py --checkpoint ./generator.ckpt
+'''
+
+def read_best(pointer_path):
+    # dev MSE of the weights saved by an earlier run of the evaluator
+    if not os.path.exists(pointer_path):
+        return np.inf
+    with open(pointer_path) as f:
+        return json.load(f)['dev_mse']
+
+def write_best(pointer_path, best):
+    tmp_path = pointer_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(best, f)
+    os.rename(tmp_path, pointer_path)
+
+def build_model(checkpoint_path, weights_path):
+    '''
+    Builds the graph of the checkpoint at @checkpoint_path, on the data it
+    was trained on (from the metadata written next to it), in inference
+    mode and on the CPU
+    :return: the model, its session and a Saver of its variables
+    '''
+    config = Config()
+    # the evaluator writes no checkpoints of its own
+    config.checkpoint_path = None
+    config.weights_path = weights_path
+    meta = myio_load_checkpoint_meta(checkpoint_path)
+    paths = meta['data_paths']
+    config.stream_train = meta['stream_train']
+    config.span_len = meta['span_len']
+    config.length_policy = 'fixed'
+    config.length_cap = meta['max_sentence']
+    config.cell_type = meta['cell_type']
+    config.n_layers = meta['n_layers']
+    config.hidden_size = meta['hidden_size']
+    config.selection = meta['selection']
+    config.aspects = meta['aspects']
+    # a checkpoint holds the variables of a single tower
+    config.n_towers = 1
+
+    graph = tf.Graph()
+    with graph.as_default():
+        print "Building model...",
+        start = time.time()
+        model = RNNGeneratorModel(config, paths['embedding'], paths['train'], paths['dev'],
+                                  paths['test'], paths['annotations'])
+        print "took {:.2f} seconds\n".format(time.time() - start)
+        # token ids are only meaningful for the vocabulary the checkpoint
+        # was trained with
+        if myio_load_vocab(checkpoint_path) != model.vocab:
+            raise ValueError("vocabulary differs from {:}.vocab.txt".format(checkpoint_path))
+        model.inference_mode = True
+        init = tf.global_variables_initializer()
+        saver = tf.train.Saver()
+        # keep the accelerator to the trainer
+        session = tf.Session(config=tf.ConfigProto(device_count={'GPU': 0}))
+        session.run(init)
+        model.init_embeddings(session)
+    return model, session, saver
+
+def evaluate(model, session, saver, arrays, state, args):
+    '''
+    Scores one checkpoint and saves it if it is the best so far
+    :return: the metrics record
+    '''
+    start = time.time()
+    with session.graph.as_default():
+        model.load_checkpoint_variables(session, arrays, state, args.checkpoint)
+        dev_mse = model.run_dev(session)
+        test_mse, test_precision = model.run_test(session)
+    record = {'epoch': state['epoch'],
+              'step': state['step'],
+              'dev_mse': dev_mse.tolist(),
+              'test_mse': test_mse.tolist(),
+              'test_precision': test_precision,
+              'seconds': time.time() - start,
+              'time': time.time()}
+    mean_dev_mse = float(np.mean(dev_mse))
+    if mean_dev_mse < read_best(args.weights + '.best.json'):
+        print "New best dev MSE! Saving model in {:}".format(args.weights)
+        with session.graph.as_default():
+            model.save_weights(session, saver, args.weights)
+        write_best(args.weights + '.best.json',
+                   {'weights_path': args.weights,
+                    'checkpoint': args.checkpoint,
+                    'epoch': state['epoch'],
+                    'step': state['step'],
+                    'dev_mse': mean_dev_mse})
+        record['best'] = True
+    return record
+
+def main():
+    argparser = argparse.ArgumentParser(description="Evaluate generator checkpoints as they are written")
+    argparser.add_argument("--checkpoint", default=Config.checkpoint_path,
+                           help="checkpoint written by the trainer")
+    argparser.add_argument("--weights", default=Config.weights_path,
+                           help="where the best checkpoint is saved")
+    argparser.add_argument("--poll", type=float, default=30.0,
+                           help="seconds between looks at the checkpoint")
+    argparser.add_argument("--once", action="store_true",
+                           help="evaluate the current checkpoint and exit")
+    args = argparser.parse_args()
+    metrics_path = args.checkpoint + '.eval.jsonl'
+
+    model = None
+    last = None
+    last_mtime = None
+    while True:
+        # the trainer renames every complete checkpoint into place, so a new
+        # modification time means a new checkpoint
+        mtime = os.path.getmtime(args.checkpoint + '.npz') if os.path.exists(args.checkpoint + '.npz') else None
+        arrays, state = None, None
+        if mtime != last_mtime:
+            arrays, state = load_checkpoint(args.checkpoint)
+            last_mtime = mtime
+        if state is not None and (state['epoch'], state['step']) != last:
+            if model is None:
+                model, session, saver = build_model(args.checkpoint, args.weights)
+            print 80 * "="
+            print "EVALUATING epoch {:}, step {:}".format(state['epoch'], state['step'])
+            print 80 * "="
+            record = evaluate(model, session, saver, arrays, state, args)
+            with open(metrics_path, 'a') as fout:
+                fout.write(json.dumps(record) + "\n")
+            last = (state['epoch'], state['step'])
+        elif mtime is None and args.once:
+            print "No checkpoint at {:}".format(args.checkpoint)
+        if args.once:
+            break
+        time.sleep(args.poll)
+    if model is not None:
+        session.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import time
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+from config import Config
+from generator import RNNGeneratorModel, load_data
+from generator import train, dev, embedding, test, annotations
+from utils.general_utils import get_bucket_batches, get_bucketed_minibatches
+
+'''
+Scaling efficiency of data-parallel training (Config.n_towers): times the
+same training batches with 1 .. N graph towers and reports the throughput,
+the speedup over one tower and the efficiency (speedup / towers)
+'''
+
+def time_towers(n_towers, data, n_batches, n_warmup):
+    '''
+    Builds a model with @n_towers towers and runs @n_warmup untimed and
+    @n_batches timed training steps; the batches are drawn with a fixed
+    seed, so every tower count trains on the same ones
+    :return: trained reviews per second
+    '''
+    config = Config()
+    config.n_towers = n_towers
+    config.checkpoint_path = None
+    with tf.Graph().as_default():
+        model = RNNGeneratorModel(config, embedding, train, dev, test, annotations,
+                                  data=data)
+        init = tf.global_variables_initializer()
+        with tf.Session() as session:
+            session.run(init)
+            model.init_embeddings(session)
+            np.random.seed(1234)
+            bucket_batches = get_bucket_batches(model.train_x.lengths, config.batch_size, model.buckets)
+            batches = get_bucketed_minibatches(model.train_x, model.train_y, model.maskId,
+                                               bucket_batches[:n_warmup + n_batches])
+            n_examples = 0
+            for i, (train_x, train_y, train_sentLen, mask) in enumerate(batches):
+                if i == n_warmup:
+                    start = time.time()
+                model.train_on_batch(session, train_x, train_y, mask, train_sentLen)
+                if i >= n_warmup:
+                    n_examples += train_x.shape[0]
+            return n_examples / (time.time() - start)
+
+def main():
+    argparser = argparse.ArgumentParser(description="Measure data-parallel training scaling")
+    argparser.add_argument("--towers", type=int, nargs="+", default=[1, 2, 4, 8],
+                           help="tower counts to time (1 is always included)")
+    argparser.add_argument("--batches", type=int, default=50,
+                           help="timed training batches per tower count")
+    argparser.add_argument("--warmup", type=int, default=5)
+    args = argparser.parse_args()
+
+    print "Loading data...",
+    start = time.time()
+    data = load_data(Config(), embedding, train, dev, test, annotations)
+    print "took {:.2f} seconds\n".format(time.time() - start)
+
+    results = [ ]
+    for n_towers in sorted(set([1] + args.towers)):
+        throughput = time_towers(n_towers, data, args.batches, args.warmup)
+        results.append((n_towers, throughput))
+        print "{:} towers: {:.1f} reviews/s".format(n_towers, throughput)
+
+    print 80 * "="
+    base = results[0][1]
+    print "{:>7} {:>12} {:>8} {:>11}".format("towers", "reviews/s", "speedup", "efficiency")
+    for n_towers, throughput in results:
+        speedup = throughput / base
+        print "{:>7} {:>12.1f} {:>8.2f} {:>10.0%}".format(n_towers, throughput, speedup, speedup / n_towers)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import itertools
+import traceback
+import multiprocessing
+
+import numpy as np
+import tensorflow as tf
+
+from config import Config
+from generator import RNNGeneratorModel, load_data, save_data, has_saved_data, load_saved_data
+from generator import train, dev, embedding, test, annotations
+
+'''
+Hyperparameter sweep: runs RNNGeneratorModel trials concurrently in a
+process pool, each with its own TensorFlow thread limit. The data is
+preprocessed once into a directory of .npy files that every trial
+memory-maps, and each finished trial appends one JSON line (parameters,
+timing, best dev MSE and the metrics of every epoch) to the results file.
+
+    python generator_sweep.py --mode grid --workers 4 --threads 4
+    python generator_sweep.py --mode random --trials 20 --epochs 10
+'''
+
+# values tried by --mode grid (every combination)
+grid = {
+    'lr': [0.0001, 0.0005],
+    'hidden_size': [100, 200],
+    'drop_out': [0.5],
+    'l2Reg': [1.0e-6],
+    'sparsity_factor': [0.1, 0.3],
+    'coherent_ratio': [1.0, 2.0],
+}
+
+# ranges sampled by --mode random: (low, high, 'log' or 'linear'), or a
+# list of choices
+random_space = {
+    'lr': (1.0e-5, 1.0e-3, 'log'),
+    'hidden_size': [100, 150, 200, 300],
+    'drop_out': (0.3, 0.9, 'linear'),
+    'l2Reg': (1.0e-7, 1.0e-5, 'log'),
+    'sparsity_factor': (0.05, 1.0, 'log'),
+    'coherent_ratio': (0.5, 4.0, 'linear'),
+}
+
+def grid_trials(space):
+    names = sorted(space)
+    return [ dict(zip(names, values))
+             for values in itertools.product(*[ space[name] for name in names ]) ]
+
+def random_trials(space, n_trials, seed):
+    rng = random.Random(seed)
+    trials = [ ]
+    for _ in range(n_trials):
+        params = { }
+        for name, dist in sorted(space.items()):
+            if isinstance(dist, list):
+                params[name] = rng.choice(dist)
+            elif dist[2] == 'log':
+                params[name] = float(np.exp(rng.uniform(np.log(dist[0]), np.log(dist[1]))))
+            else:
+                params[name] = rng.uniform(dist[0], dist[1])
+        trials.append(params)
+    return trials
+
+# (data directory, threads per trial), set once per pool worker
+_worker_args = None
+
+def _init_worker(data_dir, n_threads):
+    global _worker_args
+    _worker_args = (data_dir, n_threads)
+
+def run_trial(trial):
+    '''
+    Pool worker: trains one trial on the memory-mapped data
+    :return: the JSON record of the trial
+    '''
+    sweep_id, trial_id, params, epochs, out_dir = trial
+    data_dir, n_threads = _worker_args
+    record = {'sweep': sweep_id, 'trial': trial_id, 'params': params,
+              'pid': os.getpid(), 'threads': n_threads, 'start': time.time()}
+    # the trial's own output goes to a log next to the results
+    name = os.path.join(out_dir, '{:}-trial{:}'.format(sweep_id, trial_id))
+    log_path = name + '.log'
+    stdout = sys.stdout
+    sys.stdout = open(log_path, 'w', 0)
+    try:
+        config = Config()
+        for key, value in params.items():
+            setattr(config, key, value)
+        if epochs is not None:
+            config.epochs = epochs
+        config.weights_path = name + '.weights'
+        config.checkpoint_path = name + '.ckpt'
+        record['weights_path'] = config.weights_path
+        session_config = tf.ConfigProto(intra_op_parallelism_threads=n_threads,
+                                        inter_op_parallelism_threads=n_threads)
+
+        with tf.Graph().as_default():
+            start = time.time()
+            model = RNNGeneratorModel(config, embedding, train, dev, test, annotations,
+                                      data=load_saved_data(data_dir))
+            record['build_seconds'] = time.time() - start
+            init = tf.global_variables_initializer()
+            saver = tf.train.Saver()
+            with tf.Session(config=session_config) as session:
+                session.run(init)
+                model.init_embeddings(session)
+                record['best_dev_mse'] = float(model.fit(session, saver))
+        record['epochs'] = model.history
+        record['status'] = 'ok'
+    except Exception as e:
+        record['status'] = 'error'
+        record['error'] = '{:}: {:}'.format(type(e).__name__, e)
+        traceback.print_exc(file=sys.stdout)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    record['end'] = time.time()
+    record['seconds'] = record['end'] - record['start']
+    return record
+
+def main():
+    argparser = argparse.ArgumentParser(description="Run a hyperparameter sweep of generator.py")
+    argparser.add_argument("--mode", choices=["grid", "random"], default="grid")
+    argparser.add_argument("--trials", type=int, default=16,
+                           help="number of trials of a random search")
+    argparser.add_argument("--seed", type=int, default=1234)
+    argparser.add_argument("--epochs", type=int, default=None,
+                           help="epochs per trial (default: Config.epochs)")
+    argparser.add_argument("--threads", type=int, default=4,
+                           help="TensorFlow threads of each trial")
+    argparser.add_argument("--workers", type=int, default=None,
+                           help="concurrent trials (default: cores / threads)")
+    argparser.add_argument("--data_dir", default="./sweep_data",
+                           help="preprocessed data shared by the trials")
+    argparser.add_argument("--out_dir", default="./sweep")
+    args = argparser.parse_args()
+
+    if args.mode == "grid":
+        trials = grid_trials(grid)
+    else:
+        trials = random_trials(random_space, args.trials, args.seed)
+    n_workers = args.workers or max(1, multiprocessing.cpu_count() // args.threads)
+
+    if not has_saved_data(args.data_dir):
+        print "Preprocessing data into {:}...".format(args.data_dir),
+        start = time.time()
+        save_data(load_data(Config(), embedding, train, dev, test, annotations), args.data_dir)
+        print "took {:.2f} seconds\n".format(time.time() - start)
+    if not os.path.isdir(args.out_dir):
+        os.makedirs(args.out_dir)
+    results_path = os.path.join(args.out_dir, 'results.jsonl')
+
+    print "{:} trials on {:} workers with {:} threads each".format(len(trials), n_workers, args.threads)
+    # one trial per worker process, so each starts with a fresh TensorFlow
+    # runtime and gives its memory back when it ends
+    pool = multiprocessing.Pool(n_workers, _init_worker, (args.data_dir, args.threads),
+                                maxtasksperchild=1)
+    start = time.time()
+    best = None
+    try:
+        sweep_id = time.strftime('%Y%m%d-%H%M%S')
+        jobs = [ (sweep_id, i, params, args.epochs, args.out_dir) for i, params in enumerate(trials) ]
+        with open(results_path, 'a') as fout:
+            for record in pool.imap_unordered(run_trial, jobs):
+                fout.write(json.dumps(record) + "\n")
+                fout.flush()
+                if record['status'] == 'ok':
+                    print "trial {:}: best dev MSE {:.5f} in {:.0f}s {:}".format(
+                        record['trial'], record['best_dev_mse'], record['seconds'], record['params'])
+                    if best is None or record['best_dev_mse'] < best['best_dev_mse']:
+                        best = record
+                else:
+                    print "trial {:} failed: {:}".format(record['trial'], record['error'])
+    finally:
+        pool.close()
+        pool.join()
+
+    print 80 * "="
+    print "{:} trials in {:.0f}s, results in {:}".format(len(trials), time.time() - start, results_path)
+    if best is not None:
+        print "best: trial {:}, dev MSE {:.5f} {:}".format(best['trial'], best['best_dev_mse'], best['params'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import time
+import argparse
+
+import tensorflow as tf
+
+from config import Config
+from generator import RNNGeneratorModel, load_data
+from generator import train, dev, embedding, test, annotations
+
+'''
+Architecture sweep: trains several RNNGeneratorModel variants one after the
+other, each in its own graph and session, over a single copy of the data.
+The corpora and embeddings are read (and memory-mapped from their caches)
+once instead of once per variant.
+'''
+
+# name -> Config overrides
+variants = [
+    ('rnn', {'cell_type': 'rnn'}),
+    ('gru', {'cell_type': 'gru'}),
+    ('lstm', {'cell_type': 'lstm'}),
+    ('lstm-1layer', {'cell_type': 'lstm', 'n_layers': 1}),
+    ('lstm-span', {'cell_type': 'lstm', 'selection': 'span'}),
+    ('lstm-span-lstm', {'cell_type': 'lstm', 'selection': 'span_lstm'}),
+]
+
+def train_variant(name, options, data, epochs=None):
+    '''
+    Builds and trains one variant on the shared @data
+    :return: best dev MSE
+    '''
+    config = Config()
+    for key, value in options.items():
+        setattr(config, key, value)
+    if epochs is not None:
+        config.epochs = epochs
+    config.weights_path = './generator-{:}.weights'.format(name)
+    config.checkpoint_path = './generator-{:}.ckpt'.format(name)
+
+    with tf.Graph().as_default():
+        print "Building {:}...".format(name),
+        start = time.time()
+        model = RNNGeneratorModel(config, embedding, train, dev, test, annotations,
+                                  data=data)
+        print "took {:.2f} seconds\n".format(time.time() - start)
+
+        init = tf.global_variables_initializer()
+        saver = tf.train.Saver()
+        with tf.Session() as session:
+            session.run(init)
+            model.init_embeddings(session)
+            return model.fit(session, saver)
+
+def main():
+    argparser = argparse.ArgumentParser(description="Train generator variants on one loaded dataset")
+    argparser.add_argument("--variants", nargs="+", default=[ name for name, _ in variants ],
+                           help="variants to train, from: " + " ".join(name for name, _ in variants))
+    argparser.add_argument("--epochs", type=int, default=None,
+                           help="epochs per variant (default: Config.epochs)")
+    args = argparser.parse_args()
+    options = dict(variants)
+    for name in args.variants:
+        if name not in options:
+            raise ValueError("unknown variant: {:}".format(name))
+
+    print "Loading data...",
+    start = time.time()
+    data = load_data(Config(), embedding, train, dev, test, annotations)
+    print "took {:.2f} seconds\n".format(time.time() - start)
+
+    results = [ ]
+    for name in args.variants:
+        print 80 * "="
+        print "TRAINING {:}".format(name)
+        print 80 * "="
+        start = time.time()
+        best_dev_mse = train_variant(name, options[name], data, args.epochs)
+        results.append((name, best_dev_mse, time.time() - start))
+
+    print 80 * "="
+    for name, best_dev_mse, elapsed in results:
+        print "{:<16} best dev MSE {:.5f} ({:.0f}s)".format(name, best_dev_mse, elapsed)
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,11 @@
 
+import os
+import numpy as np
 import tensorflow as tf
 from generator import RNNGeneratorModel
+from frozen_generator import FrozenGenerator
 from config import Config
+from preprocess import myio_load_vocab, myio_load_checkpoint_meta, myio_read_annotations
 import time
 
 # train = '/home/neuron/beer/reviews.aspect1.train.txt.gz'
@@ -18,22 +22,51 @@ annotations = '/Users/henryneeb/CS224N-Project/source/rcnn-master/beer/annotatio
 
 outFile = 'generator-RNN-testpreds.txt'
 
-config = Config()
+graphFile = './generator.pb'
 
-with tf.Graph().as_default():
-    print "Building model...",
-    start = time.time()
-    # Construct a raw model
-    model = RNNGeneratorModel(config, embedding, train, dev, test,
-                                       annotations)
-    print "took {:.2f} seconds\n".format(time.time() - start)
-    # init = tf.global_variables_initializer()
-    saver = tf.train.Saver()
+if not os.path.exists(graphFile):
+    # one-off export of ./generator.weights; later runs only load the
+    # frozen graph and its vocabulary
+    config = Config()
+    # rebuild the architecture and truncation length the weights were
+    # trained with
+    meta = myio_load_checkpoint_meta('./generator.weights')
+    config.length_policy = 'fixed'
+    config.length_cap = meta['max_sentence']
+    config.cell_type = meta.get('cell_type', config.cell_type)
+    config.n_layers = meta.get('n_layers', config.n_layers)
+    config.hidden_size = meta.get('hidden_size', config.hidden_size)
+    config.selection = meta.get('selection', config.selection)
+    config.aspects = meta.get('aspects', config.aspects)
 
-    with tf.Session() as session:
-        # session.run(init)
-        saver.restore(session, './generator.weights')
-        model.save_preds(session, outFile)
-        print 'Finished predictions'
+    with tf.Graph().as_default():
+        print "Building model...",
+        start = time.time()
+        # Construct a raw model
+        model = RNNGeneratorModel(config, embedding, train, dev, test,
+                                           annotations)
+        print "took {:.2f} seconds\n".format(time.time() - start)
+        # token ids are only meaningful for the vocabulary the weights were trained with
+        if myio_load_vocab('./generator.weights') != model.vocab:
+            raise ValueError("vocabulary differs from ./generator.weights.vocab.txt")
+        saver = tf.train.Saver()
 
+        with tf.Session() as session:
+            saver.restore(session, './generator.weights')
+            model.init_embeddings(session)
+            model.export_inference_graph(session, graphFile)
 
+print "Loading frozen generator...",
+start = time.time()
+generator = FrozenGenerator(graphFile)
+print "took {:.2f} seconds\n".format(time.time() - start)
+
+reviews, _, _ = myio_read_annotations(test)
+_, rationales = generator.predict(reviews)
+preds = np.zeros((len(rationales), generator.max_sentence), dtype=int)
+for i, z in enumerate(rationales):
+    preds[i, :len(z)] = z
+with open(outFile, 'wb') as f:
+    np.savetxt(f, preds, delimiter=' ')
+generator.close()
+print 'Finished predictions'
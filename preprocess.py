@@ -1,6 +1,8 @@
 
 import os, sys, gzip
 import time
+import hashlib
+import multiprocessing
 import math
 import json
 import cPickle as pickle
@@ -10,6 +12,8 @@ import random
 import argparse
 from collections import OrderedDict
 
+from utils.general_utils import load_embedding_file
+
 class EmbeddingLayer(object):
     '''
         Embedding layer that
@@ -27,9 +31,13 @@ class EmbeddingLayer(object):
         embs            : an iterator of (word, vector) pairs; these will be added to
                             the layer
         fix_init_embs   : whether to fix the initial word vectors loaded from embs
+        dtype           : storage type of the embedding matrix; float32 by
+                            default, float16 halves its memory (the model
+                            upcasts the looked-up vectors)
 
     '''
-    def __init__(self, n_d, vocab, oov="<unk>", embs=None, fix_init_embs=True):
+    def __init__(self, n_d, vocab, oov="<unk>", embs=None, fix_init_embs=True,
+                 dtype=np.float32):
 
         if embs is not None:
             lst_words = [ ]
@@ -53,11 +61,11 @@ class EmbeddingLayer(object):
             for word in vocab:
                 if word not in vocab_map:
                     vocab_map[word] = len(vocab_map)
-                    emb_vals.append(random_init((n_d,))*(0.001 if word != oov else 0.0))
+                    emb_vals.append(random_init((n_d,), dtype=dtype)*(0.001 if word != oov else 0.0))
                     lst_words.append(word)
 
             #emb_vals = np.vstack(emb_vals).astype(theano.config.floatX)
-            emb_vals = np.vstack(emb_vals).astype(float)
+            emb_vals = np.vstack(emb_vals).astype(dtype)
             self.vocab_map = vocab_map
             self.lst_words = lst_words
         else:
@@ -70,9 +78,32 @@ class EmbeddingLayer(object):
 
             self.lst_words = lst_words
             self.vocab_map = vocab_map
-            emb_vals = random_init((len(self.vocab_map), n_d))
+            emb_vals = random_init((len(self.vocab_map), n_d), dtype=dtype)
             self.init_end = -1
 
+        self._set_embeddings(emb_vals, n_d, oov)
+
+    @classmethod
+    def from_arrays(cls, lst_words, embeddings, oov="<unk>", dtype=None):
+        '''
+            Build the layer directly from a word list and its matching
+            embedding matrix, e.g. a memory-mapped cache written by
+            myio_save_embedding_cache. The matrix is used as-is (no copy)
+            unless a different storage dtype is requested.
+        '''
+        if dtype is not None and embeddings.dtype != dtype:
+            embeddings = embeddings.astype(dtype)
+        layer = cls.__new__(cls)
+        layer.lst_words = list(lst_words)
+        layer.vocab_map = dict((w, i) for i, w in enumerate(layer.lst_words))
+        assert len(layer.vocab_map) == embeddings.shape[0], \
+            "vocab size ({}) != number of vectors ({})".format(
+                len(layer.vocab_map), embeddings.shape[0])
+        layer.init_end = -1
+        layer._set_embeddings(embeddings, embeddings.shape[1], oov)
+        return layer
+
+    def _set_embeddings(self, emb_vals, n_d, oov):
         if oov is not None and oov is not False:
             assert oov in self.vocab_map, "oov {} not in vocab".format(oov)
             self.oov_tok = oov
@@ -121,11 +152,47 @@ class EmbeddingLayer(object):
                     dtype="int32"
                 )
         else:
-            return np.array(
-                    [ vocab_map.get(x, oov_id) for x in words ],
-                    dtype="int32"
+            return np.fromiter(
+                    (vocab_map.get(x, oov_id) for x in words),
+                    dtype=np.int32, count=len(words)
                 )
 
+    def map_corpus_to_ids(self, corpus, filter_oov=False):
+        '''
+            map a whole tokenized corpus into integer IDs at once, in a
+            single pass of dictionary lookups written straight into one
+            array, without a per-review array
+
+            Inputs
+            ------
+
+            corpus          : a list of lists of string tokens
+            filter_oov      : whether to remove oov tokens in the returned array
+
+
+            Outputs
+            -------
+
+            return the int32 array of all word IDs and the int64 array of
+            row offsets; row i is ids[offsets[i]:offsets[i+1]]
+
+        '''
+        lengths = np.fromiter((len(words) for words in corpus),
+                              dtype=np.int64, count=len(corpus))
+        vocab_map, oov_id = self.vocab_map, self.oov_id
+        ids = np.fromiter((vocab_map.get(w, oov_id) for words in corpus for w in words),
+                          dtype=np.int32, count=int(lengths.sum()))
+
+        if filter_oov:
+            keep = ids != self.oov_id
+            rows = np.repeat(np.arange(len(corpus)), lengths)
+            lengths = np.bincount(rows[keep], minlength=len(corpus)).astype(np.int64)
+            ids = ids[keep]
+
+        offsets = np.zeros(len(corpus) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return ids, offsets
+
     def forward(self, x):
         '''
             Fetch and return the word embeddings given word IDs x
@@ -156,7 +223,7 @@ def say(s, stream=sys.stdout):
     stream.flush()
 
 default_rng = np.random.RandomState(random.randint(0,9999))
-def random_init(size, rng=None, rng_type=None):
+def random_init(size, rng=None, rng_type=None, dtype=np.float32):
     if rng is None: rng = default_rng
     if rng_type is None:
         #vals = rng.standard_normal(size)
@@ -173,7 +240,7 @@ def random_init(size, rng=None, rng_type=None):
             "unknown random inittype: {}".format(rng_type)
           )
 
-    return vals.astype(float)
+    return vals.astype(dtype)
 
 
 def myio_read_annotations(path):
@@ -197,98 +264,535 @@ def myio_read_annotations(path):
 
 
 def load_embedding_iterator(path):
-    file_open = gzip.open if path.endswith(".gz") else open
-    with file_open(path) as fin:
-        for line in fin:
-            line = line.strip()
-            if line:
-                parts = line.split()
-                word = parts[0]
-                vals = np.array([ float(x) for x in parts[1:] ])
-                yield word, vals
+    words, vectors = load_embedding_file(path)
+    for word, vals in zip(words, vectors):
+        yield word, vals
 
 ### /utils/__init__.py END ###
 
 ### myio.py BEGIN ###
 
-def myio_create_embedding_layer(path):
-    embedding_layer = EmbeddingLayer(
-            n_d = 200,
-            vocab = [ "<unk>", "<padding>" ],
-            embs = load_embedding_iterator(path),
-            oov = "<unk>",
-            #fix_init_embs = True
-            fix_init_embs = False
-        )
+def _embedding_cache_paths(path):
+    '''
+    Paths of the binary cache kept next to a text embedding file, e.g.
+    review+wiki.filtered.200.txt.gz -> review+wiki.filtered.200.vocab.txt
+    and review+wiki.filtered.200.npy
+    '''
+    base = path[:-len(".gz")] if path.endswith(".gz") else path
+    base = os.path.splitext(base)[0]
+    return base + ".vocab.txt", base + ".npy"
+
+def myio_has_embedding_cache(path):
+    '''
+    True if the binary cache for @path exists and is newer than @path
+    '''
+    vocab_path, matrix_path = _embedding_cache_paths(path)
+    if not (os.path.exists(vocab_path) and os.path.exists(matrix_path)):
+        return False
+    src_time = os.path.getmtime(path) if os.path.exists(path) else 0
+    return min(os.path.getmtime(vocab_path), os.path.getmtime(matrix_path)) >= src_time
+
+def myio_save_embedding_cache(embedding_layer, path):
+    '''
+    Write the vocabulary (one token per line) and the float32 embedding
+    matrix of @embedding_layer next to the text embedding file @path.
+    Files are written under a temporary name and renamed so concurrent
+    jobs never see a half-written cache.
+    '''
+    vocab_path, matrix_path = _embedding_cache_paths(path)
+    suffix = ".{}.tmp".format(os.getpid())
+    with open(vocab_path + suffix, "w") as fout:
+        for word in embedding_layer.lst_words:
+            fout.write(word + "\n")
+    with open(matrix_path + suffix, "wb") as fout:
+        np.save(fout, np.asarray(embedding_layer.embeddings, dtype=np.float32))
+    os.rename(matrix_path + suffix, matrix_path)
+    os.rename(vocab_path + suffix, vocab_path)
+    say("embedding cache written to {}\n".format(matrix_path))
+
+def myio_load_embedding_cache(path, oov="<unk>", dtype=np.float32):
+    '''
+    Load the embedding layer from the binary cache of @path. The float32
+    matrix is memory-mapped read-only, so jobs on one machine share the page
+    cache; another @dtype loads a converted copy.
+    '''
+    vocab_path, matrix_path = _embedding_cache_paths(path)
+    with open(vocab_path) as fin:
+        lst_words = [ line.rstrip("\n") for line in fin ]
+    embeddings = np.load(matrix_path, mmap_mode="r")
+    say("{} embeddings memory-mapped from {}\n".format(len(lst_words), matrix_path))
+    return EmbeddingLayer.from_arrays(lst_words, embeddings, oov=oov, dtype=dtype)
+
+def myio_create_embedding_layer(path, use_cache=True, dtype=np.float32):
+    '''
+    Build the embedding layer for the text embedding file @path, stored as
+    @dtype. With @use_cache, a fresh binary cache is memory-mapped instead of
+    parsing the text file, and a missing or stale cache is written after
+    parsing.
+    '''
+    if use_cache and myio_has_embedding_cache(path):
+        return myio_load_embedding_cache(path, dtype=dtype)
+
+    # built and cached at float32 whatever @dtype is, so a float16 run
+    # never leaves rounded vectors in the cache for later float32 runs.
+    # The special tokens go into rows reserved by the parser, so the
+    # matrix is never copied
+    specials = [ "<unk>", "<padding>" ]
+    lst_words, embeddings = load_embedding_file(path, extra_rows=len(specials))
+    say("{} pre-trained embeddings loaded.\n".format(len(lst_words)))
+    known = set(lst_words)
+    for word in specials:
+        if word not in known:
+            # as in EmbeddingLayer: <unk> is zero, others are small random
+            embeddings[len(lst_words)] = random_init((embeddings.shape[1],))*(0.001 if word != "<unk>" else 0.0)
+            lst_words.append(word)
+    embedding_layer = EmbeddingLayer.from_arrays(lst_words, embeddings[:len(lst_words)],
+                                                 oov="<unk>", dtype=np.float32)
+    if use_cache:
+        try:
+            myio_save_embedding_cache(embedding_layer, path)
+        except (IOError, OSError) as e:
+            say("WARNING: could not write embedding cache for {}: {}\n".format(path, e))
+    if embedding_layer.embeddings.dtype != dtype:
+        embedding_layer = EmbeddingLayer.from_arrays(embedding_layer.lst_words,
+                                                     embedding_layer.embeddings,
+                                                     oov="<unk>", dtype=dtype)
     return embedding_layer
 
-def padData(data, embeddingDict):
+def _corpus_cache_prefix(path, embedding_layer):
     '''
-    Adds padding ids to fill our training data so all reviews are the same size
-    :param data: training data with the tokenized reviews
-    :param embeddingDict: the embedding dictionary with pretrained vectors
-    :return: padded data and embedding with padding word vector
+    Cache prefix for the tokenized form of @path, keyed by a hash of the
+    file contents and of the vocabulary used to map tokens to ids
+    '''
+    digest = hashlib.sha1()
+    with open(path, "rb") as fin:
+        for block in iter(lambda: fin.read(1 << 20), b""):
+            digest.update(block)
+    digest.update("\n".join(embedding_layer.lst_words))
+    digest.update(str(embedding_layer.oov_id))
+    base = path[:-len(".gz")] if path.endswith(".gz") else path
+    return "{}.{}".format(base, digest.hexdigest()[:16])
+
+def myio_save_corpus_cache(prefix, ids, offsets, labels):
+    suffix = ".{}.tmp".format(os.getpid())
+    for name, arr in (("labels", labels), ("offsets", offsets), ("ids", ids)):
+        with open("{}.{}.npy{}".format(prefix, name, suffix), "wb") as fout:
+            np.save(fout, arr)
+    # ids is renamed last, its presence marks a complete cache
+    for name in ("labels", "offsets", "ids"):
+        os.rename("{}.{}.npy{}".format(prefix, name, suffix),
+                  "{}.{}.npy".format(prefix, name))
+
+def myio_load_corpus_cache(prefix):
+    return tuple(np.load("{}.{}.npy".format(prefix, name), mmap_mode="r")
+                 for name in ("ids", "offsets", "labels"))
+
+# (vocab_map, oov_id) of the embedding layer, set once per pool worker
+_worker_vocab = None
+
+def _init_annotation_worker(vocab_map, oov_id):
+    global _worker_vocab
+    _worker_vocab = (vocab_map, oov_id)
+
+def _parse_annotation_chunk(lines):
+    '''
+    Pool worker: tokenize a chunk of annotation lines, map tokens to ids
+    and parse scores. Returns the chunk in CSR form (ids, lengths, labels)
     '''
-    maskId = embeddingDict.shape[0]
+    vocab_map, oov_id = _worker_vocab
+    ids, lengths, labels = [ ], [ ], [ ]
+    for line in lines:
+        y, sep, x = line.partition("\t")
+        x = x.split()
+        if len(x) == 0: continue
+        ids.extend(vocab_map.get(w, oov_id) for w in x)
+        lengths.append(len(x))
+        labels.append(y.split())
+    return (np.array(ids, dtype=np.int32),
+            np.array(lengths, dtype=np.int64),
+            np.array(labels, dtype=np.float32))
+
+def _read_line_chunks(path, chunk_bytes):
+    fopen = gzip.open if path.endswith(".gz") else open
+    with fopen(path) as fin:
+        while True:
+            lines = fin.readlines(chunk_bytes)
+            if not lines: break
+            yield lines
 
-    # Find the max sentence length
-    # maxLength = np.max(map(len, data))
-    maxLength = 1145
+def myio_read_corpus_parallel(path, embedding_layer, n_workers=None, chunk_bytes=1 << 22):
+    '''
+    Parallel version of the tokenization in myio_read_corpus. The
+    decompressed stream is split into line-aligned chunks of about
+    @chunk_bytes, which a pool of @n_workers processes (default: one per
+    core) tokenize and map to ids. Chunks are merged in file order.
+    :return: int32 ids, int64 offsets (n + 1), float32 labels (n x n_labels)
+    '''
+    n_workers = n_workers or multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(n_workers, _init_annotation_worker,
+                                (embedding_layer.vocab_map, embedding_layer.oov_id))
+    try:
+        chunks = [ chunk for chunk in
+                   pool.imap(_parse_annotation_chunk, _read_line_chunks(path, chunk_bytes))
+                   if len(chunk[1]) > 0 ]
+    finally:
+        pool.close()
+        pool.join()
+
+    ids = np.concatenate([ chunk[0] for chunk in chunks ])
+    lengths = np.concatenate([ chunk[1] for chunk in chunks ])
+    labels = np.concatenate([ chunk[2] for chunk in chunks ])
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    say("{} examples loaded from {} with {} workers\n".format(
+            len(lengths), path, n_workers
+        ))
+    say("max text length: {}\n".format(lengths.max()))
+    return ids, offsets, labels
 
-    # Get the length of each sentence
-    sentLen = np.array(map(len, data), dtype=np.int32)
-    sentDiff = maxLength - sentLen
+def myio_read_corpus(path, embedding_layer, use_cache=True, n_workers=None):
+    '''
+    Read an annotation file as token ids in CSR form: review i is
+    ids[offsets[i]:offsets[i+1]]. With @use_cache the result is saved next
+    to @path on the first call and memory-mapped on later calls, so
+    tokenization runs once per (file, vocabulary) pair. Tokenization uses
+    @n_workers processes (default: one per core; 1 reads in this process).
+    :return: int32 ids, int64 offsets (n + 1), float32 labels (n x n_labels)
+    '''
+    prefix = _corpus_cache_prefix(path, embedding_layer) if use_cache else None
+    if prefix is not None and os.path.exists(prefix + ".ids.npy"):
+        ids, offsets, labels = myio_load_corpus_cache(prefix)
+        say("{} examples memory-mapped from {}.*.npy\n".format(len(labels), prefix))
+        return ids, offsets, labels
+
+    if n_workers == 1:
+        data_x, data_y, _ = myio_read_annotations(path)
+        ids, offsets = embedding_layer.map_corpus_to_ids(data_x)
+        labels = np.array(data_y, dtype=np.float32)
+    else:
+        ids, offsets, labels = myio_read_corpus_parallel(path, embedding_layer, n_workers)
 
-    # Fill each sentence to max sentence length
-    paddings = [np.full(shape=x, fill_value=maskId, dtype=np.int32) for x in
-                sentDiff]
-    sentAndPad = zip(data, paddings)
-    dataPad = [np.append(x[0], x[1]) for x in sentAndPad]
-    dataPad = np.array(dataPad)
+    if prefix is not None:
+        try:
+            myio_save_corpus_cache(prefix, ids, offsets, labels)
+        except (IOError, OSError) as e:
+            say("WARNING: could not write corpus cache for {}: {}\n".format(path, e))
+    return ids, offsets, labels
 
-    # Add extra padding vector to embeddings
-    embedding_size = embeddingDict.shape[1]
-    paddEmbed = np.zeros(shape=(1, embedding_size), dtype=np.float32)
-    embeddingDictPad = np.append(embeddingDict, paddEmbed, axis=0)
+class RaggedArray(object):
+    '''
+        Variable-length rows of token ids stored once as a flat values array
+        plus row offsets (CSR layout): row i is values[offsets[i]:offsets[i+1]].
+        Padded matrices are only materialized per minibatch by pad().
+
+        Inputs
+        ------
+
+        values          : flat int32 array of token ids
+        offsets         : int64 array of n + 1 row boundaries
+    '''
+    def __init__(self, values, offsets):
+        self.values = values
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.lengths = np.diff(self.offsets).astype(np.int32)
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def __getitem__(self, i):
+        return self.values[self.offsets[i]:self.offsets[i + 1]]
+
+    def _gather_index(self, indices, lengths):
+        # position of every kept token of rows @indices (first @lengths
+        # tokens of each row) in self.values, in row-major order
+        starts = self.offsets[indices]
+        out_starts = np.cumsum(lengths) - lengths
+        return np.repeat(starts - out_starts, lengths) + np.arange(lengths.sum())
+
+    def take(self, indices):
+        '''
+            Return a new RaggedArray holding rows @indices
+        '''
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = self.lengths[indices].astype(np.int64)
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return RaggedArray(self.values[self._gather_index(indices, lengths)], offsets)
+
+    def pad(self, indices, pad_id, width=None):
+        '''
+            Materialize rows @indices as a dense padded batch
+
+            Inputs
+            ------
+
+            indices         : row indices of the batch
+            pad_id          : id written after the end of each row
+            width           : number of columns; rows longer than it are
+                                truncated. Defaults to the longest row in
+                                the batch
+
+            Outputs
+            -------
+
+            int32 ids (batch x width), bool mask (batch x width) and the
+            int32 (truncated) length of each row
+        '''
+        indices = np.asarray(indices, dtype=np.int64)
+        lengths = self.lengths[indices]
+        if width is None:
+            width = max(int(lengths.max()), 1) if len(indices) > 0 else 1
+        lengths = np.minimum(lengths, width).astype(np.int32)
+
+        mask = np.arange(width)[None, :] < lengths[:, None]
+        batch = np.full((len(indices), width), pad_id, dtype=np.int32)
+        batch[mask] = self.values[self._gather_index(indices, lengths)]
+        return batch, mask, lengths
+
+def shuffle_buffer(items, window, rng=None):
+    '''
+    Approximately shuffle a stream while holding at most @window items:
+    each incoming item replaces a random buffered one, which is emitted
+    '''
+    if rng is None: rng = np.random
+    buf = [ ]
+    for item in items:
+        if len(buf) < window:
+            buf.append(item)
+            continue
+        j = rng.randint(window)
+        yield buf[j]
+        buf[j] = item
+    rng.shuffle(buf)
+    for item in buf:
+        yield item
+
+class AnnotationStream(object):
+    '''
+        Bounded-memory view of an annotation file for training on corpora
+        larger than RAM. Each pass re-reads the (gz) file and runs
+        line reader -> tokenize -> map_to_ids -> shuffle buffer -> batch,
+        so only @shuffle_window reviews are held in memory at once.
+
+        Inputs
+        ------
 
-    # create mask for data
-    mask = (dataPad != maskId)
+        path            : annotation file, one "scores<TAB>review" per line
+        embedding_layer : EmbeddingLayer used to map tokens to ids
+        shuffle_window  : number of reviews in the shuffle buffer
+    '''
+    def __init__(self, path, embedding_layer, shuffle_window=10000):
+        self.path = path
+        self.embedding_layer = embedding_layer
+        self.shuffle_window = shuffle_window
+        self.n_examples = None
+
+    def _lines(self):
+        fopen = gzip.open if self.path.endswith(".gz") else open
+        with fopen(self.path) as fin:
+            for line in fin:
+                y, sep, x = line.partition("\t")
+                if x.strip():
+                    yield y, x
+
+    def __len__(self):
+        # counted once with a cheap pass that does not tokenize
+        if self.n_examples is None:
+            self.n_examples = sum(1 for _ in self._lines())
+        return self.n_examples
+
+    def examples(self):
+        map_to_ids = self.embedding_layer.map_to_ids
+        for y, x in self._lines():
+            yield map_to_ids(x.split()), np.array(y.split(), dtype=np.float32)
+
+    def minibatches(self, batch_size, pad_id, max_width=None, aspect=None,
+                    shuffle=True):
+        '''
+            Yield [x, y, sentLen, mask] minibatches like
+            get_ragged_minibatches. Each batch is padded to its longest
+            review, truncated to @max_width tokens; with @aspect only that
+            label column is kept (as an n x 1 matrix), or those columns for
+            a list of aspects
+        '''
+        examples = self.examples()
+        if shuffle:
+            examples = shuffle_buffer(examples, self.shuffle_window)
+        batch = [ ]
+        for example in examples:
+            batch.append(example)
+            if len(batch) == batch_size:
+                yield self._pad_batch(batch, pad_id, max_width, aspect)
+                batch = [ ]
+        if batch:
+            yield self._pad_batch(batch, pad_id, max_width, aspect)
+
+    def _pad_batch(self, batch, pad_id, max_width, aspect):
+        ids = [ x for x, _ in batch ]
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum([ len(x) for x in ids ], out=offsets[1:])
+        rows = RaggedArray(np.concatenate(ids), offsets)
+        width = max(int(rows.lengths.max()), 1)
+        if max_width is not None:
+            width = min(width, max_width)
+        x, mask, sentLen = rows.pad(np.arange(len(ids)), pad_id, width)
+        y = np.vstack([ y for _, y in batch ])
+        if aspect is not None:
+            y = y[:, np.atleast_1d(aspect)]
+        return [x, y, sentLen, mask]
+
+def prune_embedding_layer(embedding_layer, corpora, keep=("<unk>", "<padding>")):
+    '''
+    Keep only the vectors of words that occur in @corpora (plus the @keep
+    tokens), so the embedding matrix baked into the graph covers the data
+    instead of the whole embedding file
+    :param embedding_layer: EmbeddingLayer the corpora were mapped with
+    :param corpora: list of flat int32 id arrays (e.g. from myio_read_corpus)
+    :param keep: tokens kept even if no corpus uses them
+    :return: the pruned EmbeddingLayer and the int32 array mapping the old
+    ids to its ids (see myio_remap_corpus)
+    '''
+    used = np.zeros(embedding_layer.n_V, dtype=bool)
+    for ids in corpora:
+        used[ids] = True
+    for word in keep:
+        if word in embedding_layer.vocab_map:
+            used[embedding_layer.vocab_map[word]] = True
+    kept_ids = np.flatnonzero(used)
+
+    remap = np.full(embedding_layer.n_V, -1, dtype=np.int32)
+    remap[kept_ids] = np.arange(len(kept_ids), dtype=np.int32)
+    lst_words = [ embedding_layer.lst_words[i] for i in kept_ids ]
+    embeddings = np.asarray(embedding_layer.embeddings)[kept_ids]
+    pruned = EmbeddingLayer.from_arrays(lst_words, embeddings, oov=embedding_layer.oov_tok)
+    say("vocabulary pruned from {} to {} words\n".format(embedding_layer.n_V, pruned.n_V))
+    return pruned, remap
+
+def myio_remap_corpus(path, ids, offsets, labels, remap, pruned_layer, use_cache=True):
+    '''
+    Map the corpus of @path, read with the full vocabulary (e.g. memory-mapped
+    by myio_read_corpus), to the ids of @pruned_layer through @remap. With
+    @use_cache the remapped corpus is cached under the pruned vocabulary, so
+    later runs memory-map it instead of building a remapped copy in memory
+    :return: int32 ids, int64 offsets (n + 1), float32 labels (n x n_labels)
+    '''
+    prefix = _corpus_cache_prefix(path, pruned_layer) if use_cache else None
+    if prefix is not None and os.path.exists(prefix + ".ids.npy"):
+        return myio_load_corpus_cache(prefix)
+    ids = remap[ids]
+    if prefix is not None:
+        try:
+            myio_save_corpus_cache(prefix, ids, offsets, labels)
+        except (IOError, OSError) as e:
+            say("WARNING: could not write corpus cache for {}: {}\n".format(path, e))
+    return ids, offsets, labels
+
+def myio_save_vocab(lst_words, path):
+    '''
+    Save the word of every embedding row (one per line, in id order) next to
+    a checkpoint, so token ids can be rebuilt for the model saved at @path
+    '''
+    with open(path + ".vocab.txt", "w") as fout:
+        fout.write("\n".join(lst_words) + "\n")
+
+def myio_load_vocab(path):
+    '''
+    Read the vocabulary written by myio_save_vocab for the checkpoint at @path
+    '''
+    with open(path + ".vocab.txt") as fin:
+        return [ line.rstrip("\n") for line in fin ]
+
+def myio_save_checkpoint_meta(meta, path):
+    '''
+    Save the data-dependent settings of the model saved at @path (e.g. the
+    max_sentence picked by the length policy) as JSON next to the checkpoint
+    '''
+    with open(path + ".json", "w") as fout:
+        json.dump(meta, fout)
 
-    return dataPad, embeddingDictPad, mask, sentLen
+def myio_load_checkpoint_meta(path):
+    '''
+    Read the settings written by myio_save_checkpoint_meta for @path
+    '''
+    with open(path + ".json") as fin:
+        return json.load(fin)
 
-def readOurData(trainPath, devPath, testPath, embeddingPath):
+def padEmbeddings(embeddingDict):
     '''
-    Wrapper function that reads in padded training and development data
+    Adds an all-zero padding vector at the end of the embedding dictionary
+    :param embeddingDict: the embedding dictionary with pretrained vectors
+    :return: embedding with padding word vector; its id is the last row.
+    The storage dtype of embeddingDict is kept
+    '''
+    embedding_size = embeddingDict.shape[1]
+    paddEmbed = np.zeros(shape=(1, embedding_size), dtype=embeddingDict.dtype)
+    embeddingDictPad = np.append(embeddingDict, paddEmbed, axis=0)
+    return embeddingDictPad
+
+def readOurData(trainPath, devPath, testPath, embeddingPath, stream_train=False,
+                shuffle_window=10000, prune_vocab=True, embedding_dtype=np.float32):
+    '''
+    Wrapper function that reads in training, development and test data
     :param trainPath: path to training data
     :param devPath: path to development data
+    :param testPath: path to test data
     :param embeddingPath: path to embedding dictionary
-    :return: padded training and development data (reviews and labels).
-    Embedding dictionary with a padding vector. Also returns masks for training
-    and development data
+    :param stream_train: if True, the training data is not loaded; it is
+    returned as an AnnotationStream (with None labels) read on every epoch
+    :param shuffle_window: shuffle buffer size of the training stream
+    :param prune_vocab: if True, only the embeddings of words that occur in
+    the three files (plus <unk> and <padding>) are kept and the token ids are
+    remapped accordingly. Ignored with stream_train, whose words are only
+    seen during training
+    :param embedding_dtype: storage type of the embeddings, float32 or
+    float16 (half the memory; the model upcasts the looked-up vectors)
+    :return: reviews as RaggedArrays of token ids and their labels for
+    training, development and test data, the embedding dictionary with
+    a padding vector (id len(embedding_pad) - 1), and the word of every
+    embedding row but the padding one (save it with myio_save_vocab next to
+    the checkpoint). Padding and masks are built per minibatch with
+    RaggedArray.pad
     '''
 
     # Read in embeddings
-    embedding_layer = myio_create_embedding_layer(embeddingPath)
-    embeddingDict = embedding_layer.embeddings
+    embedding_layer = myio_create_embedding_layer(embeddingPath, dtype=embedding_dtype)
 
     # Read in training data
-    train_x, train_y, max_train = myio_read_annotations(trainPath)
-    train_y = np.array(train_y)
-    train_x = [embedding_layer.map_to_ids(x)[:max_train] for x in train_x]
+    if stream_train:
+        train_x = AnnotationStream(trainPath, embedding_layer, shuffle_window)
+        train_y = None
+    else:
+        train_ids, train_offsets, train_y = myio_read_corpus(trainPath, embedding_layer)
 
     # Read in development data
-    dev_x, dev_y, max_dev = myio_read_annotations(devPath)
-    dev_y = np.array(dev_y)
-    dev_x = [embedding_layer.map_to_ids(x)[:max_dev] for x in dev_x]
+    dev_ids, dev_offsets, dev_y = myio_read_corpus(devPath, embedding_layer)
 
     # Read in test data
-    test_x, test_y, max_test = myio_read_annotations(testPath)
-    test_y = np.array(test_y)
-    test_x = [embedding_layer.map_to_ids(x)[:max_test] for x in test_x]
-
-    # pad trainging and devlopment data
-    train_x_pad, embedding_pad, train_mask, train_sentLen = padData(train_x, embeddingDict)
-    dev_x_pad, _, dev_mask, dev_sentLen = padData(dev_x, embeddingDict)
-    test_x_pad, _, test_mask, test_sentLen = padData(test_x, embeddingDict)
-
-    return train_x_pad, train_y, train_mask, train_sentLen, dev_x_pad, dev_y, dev_mask, dev_sentLen, embedding_pad, test_x_pad, test_y, test_mask, test_sentLen
\ No newline at end of file
+    test_ids, test_offsets, test_y = myio_read_corpus(testPath, embedding_layer)
+
+    # Drop the vectors no review uses
+    if prune_vocab and not stream_train:
+        embedding_layer, remap = prune_embedding_layer(
+            embedding_layer, [train_ids, dev_ids, test_ids])
+        train_ids, train_offsets, train_y = myio_remap_corpus(
+            trainPath, train_ids, train_offsets, train_y, remap, embedding_layer)
+        dev_ids, dev_offsets, dev_y = myio_remap_corpus(
+            devPath, dev_ids, dev_offsets, dev_y, remap, embedding_layer)
+        test_ids, test_offsets, test_y = myio_remap_corpus(
+            testPath, test_ids, test_offsets, test_y, remap, embedding_layer)
+
+    if not stream_train:
+        train_x = RaggedArray(train_ids, train_offsets)
+    dev_x = RaggedArray(dev_ids, dev_offsets)
+    test_x = RaggedArray(test_ids, test_offsets)
+    embedding_pad = padEmbeddings(embedding_layer.embeddings)
+
+    return train_x, train_y, dev_x, dev_y, embedding_pad, test_x, test_y, embedding_layer.lst_words
+
+if __name__ == "__main__":
+    argparser = argparse.ArgumentParser(
+        description="Convert a text embedding file into the binary cache used by readOurData")
+    argparser.add_argument("embedding", help="path to e.g. review+wiki.filtered.200.txt.gz")
+    args = argparser.parse_args()
+    myio_save_embedding_cache(myio_create_embedding_layer(args.embedding, use_cache=False),
+                              args.embedding)
@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import tensorflow as tf
+
+from config import Config
+from generator import RNNGeneratorModel
+from generator import train, dev, embedding, test, annotations
+from preprocess import myio_load_vocab, myio_load_checkpoint_meta
+
+'''
+Post-training int8 weight quantization of a trained generator. Every weight
+matrix (W_gen, the recurrent kernels of the generator and encoder, the
+encoder output layer W and the span convolutions) is stored as int8 with
+one float32 scale per output channel; biases and the embeddings stay
+float32. The tool scores dev and test with the float32 weights and with
+the quantized ones, reports the change in dev MSE and rationale precision,
+and exports the quantized inference graph for FrozenGenerator:
+
+    python quantize_generator.py --weights ./generator.weights
+
+writes ./generator.int8.pb (and its vocabulary and metadata) and the
+report ./generator.int8.pb.report.json. In the exported graph each
+quantized matrix is an int8 constant followed by a Cast and a Mul by its
+scales. Only the graph file shrinks (about 4x for these matrices): the
+float32 matrix is rebuilt when the graph runs, so resident memory and the
+weight bandwidth of a request stay those of the float32 graph.
+'''
+
+def quantize_per_channel(w):
+    '''
+    Symmetric int8 quantization of @w with one scale per channel of its
+    last (output) axis
+    :return: int8 values, same shape as @w, and float32 scales (channels,)
+    '''
+    w = np.asarray(w, dtype=np.float32)
+    max_abs = np.abs(w.reshape(-1, w.shape[-1])).max(axis=0)
+    scale = np.where(max_abs > 0, max_abs / 127.0, 1.0).astype(np.float32)
+    q = np.clip(np.round(w / scale), -127, 127).astype(np.int8)
+    return q, scale
+
+def dequantize(q, scale):
+    # the same float32 product the exported graph computes
+    return q.astype(np.float32) * scale
+
+def quantize_graph_def(graph_def, quantized):
+    '''
+    Replaces the float32 constant of every variable in @quantized (name ->
+    (int8 values, scales)) of a frozen GraphDef by an int8 constant, its
+    scales and the ops that dequantize them, under the original node name
+    so its consumers are unchanged
+    '''
+    output = tf.GraphDef()
+    output.versions.CopyFrom(graph_def.versions)
+    output.library.CopyFrom(graph_def.library)
+    for node in graph_def.node:
+        if node.name not in quantized:
+            output.node.extend([node])
+            continue
+        q, scale = quantized[node.name]
+
+        values = output.node.add()
+        values.name = node.name + '/int8'
+        values.op = 'Const'
+        values.attr['dtype'].type = tf.int8.as_datatype_enum
+        values.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(q, dtype=tf.int8))
+
+        scales = output.node.add()
+        scales.name = node.name + '/scale'
+        scales.op = 'Const'
+        scales.attr['dtype'].type = tf.float32.as_datatype_enum
+        scales.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(scale, dtype=tf.float32))
+
+        cast = output.node.add()
+        cast.name = node.name + '/dequantize'
+        cast.op = 'Cast'
+        cast.input.extend([values.name])
+        cast.attr['SrcT'].type = tf.int8.as_datatype_enum
+        cast.attr['DstT'].type = tf.float32.as_datatype_enum
+
+        mul = output.node.add()
+        mul.name = node.name
+        mul.op = 'Mul'
+        mul.input.extend([cast.name, scales.name])
+        mul.attr['T'].type = tf.float32.as_datatype_enum
+    return output
+
+def quantizable_variables():
+    # the weight matrices; biases and other vectors are left in float32
+    return [ var for var in tf.trainable_variables() if len(var.get_shape()) >= 2 ]
+
+def score(model, session):
+    dev_mse = model.run_dev(session)
+    test_mse, test_precision = model.run_test(session)
+    return {'dev_mse': dev_mse.tolist(),
+            'test_mse': test_mse.tolist(),
+            'test_precision': test_precision}
+
+def main():
+    argparser = argparse.ArgumentParser(description="Quantize the weights of a trained generator to int8")
+    argparser.add_argument("--weights", default=Config.weights_path,
+                           help="checkpoint saved by RNNGeneratorModel.fit")
+    argparser.add_argument("--out", default=None,
+                           help="quantized inference graph (default: <weights>.int8.pb)")
+    args = argparser.parse_args()
+    out_path = args.out or os.path.splitext(args.weights)[0] + '.int8.pb'
+
+    # rebuild the graph the weights were trained with
+    config = Config()
+    meta = myio_load_checkpoint_meta(args.weights)
+    config.length_policy = 'fixed'
+    config.length_cap = meta['max_sentence']
+    config.cell_type = meta.get('cell_type', config.cell_type)
+    config.n_layers = meta.get('n_layers', config.n_layers)
+    config.hidden_size = meta.get('hidden_size', config.hidden_size)
+    config.selection = meta.get('selection', config.selection)
+    config.aspects = meta.get('aspects', config.aspects)
+    config.n_towers = 1
+    config.checkpoint_path = None
+
+    with tf.Graph().as_default():
+        print "Building model...",
+        start = time.time()
+        model = RNNGeneratorModel(config, embedding, train, dev, test, annotations)
+        print "took {:.2f} seconds\n".format(time.time() - start)
+        if myio_load_vocab(args.weights) != model.vocab:
+            raise ValueError("vocabulary differs from {:}.vocab.txt".format(args.weights))
+        model.inference_mode = True
+        saver = tf.train.Saver()
+        variables = quantizable_variables()
+
+        with tf.Session(config=tf.ConfigProto(device_count={'GPU': 0})) as session:
+            saver.restore(session, args.weights)
+            model.init_embeddings(session)
+
+            print 80 * "="
+            print "FLOAT32"
+            print 80 * "="
+            float_scores = score(model, session)
+
+            quantized = { }
+            float_bytes = 0
+            int8_bytes = 0
+            for var, value in zip(variables, session.run(variables)):
+                q, scale = quantize_per_channel(value)
+                quantized[var.op.name] = (q, scale)
+                float_bytes += value.nbytes
+                int8_bytes += q.nbytes + scale.nbytes
+            # evaluate the float32 model with the weights the int8 graph
+            # dequantizes to
+            session.run([ tf.assign(var, dequantize(*quantized[var.op.name])) for var in variables ])
+
+            print 80 * "="
+            print "INT8"
+            print 80 * "="
+            int8_scores = score(model, session)
+
+            model.export_inference_graph(session, out_path,
+                                         rewrite=lambda graph_def: quantize_graph_def(graph_def, quantized))
+
+    report = {'weights': args.weights,
+              'graph': out_path,
+              'graph_bytes': os.path.getsize(out_path),
+              'quantized': sorted(quantized),
+              'float32_bytes': float_bytes,
+              'int8_bytes': int8_bytes,
+              'float32': float_scores,
+              'int8': int8_scores}
+    with open(out_path + '.report.json', 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print 80 * "="
+    print "{:} weight matrices on disk: {:.2f} MB float32 -> {:.2f} MB int8 ({:.1f}x)".format(
+        len(quantized), float_bytes / 1e6, int8_bytes / 1e6, float(float_bytes) / int8_bytes)
+    print "graph file: {:.2f} MB".format(os.path.getsize(out_path) / 1e6)
+    print "dev MSE: {:.5f} -> {:.5f} ({:+.5f})".format(
+        np.mean(float_scores['dev_mse']), np.mean(int8_scores['dev_mse']),
+        np.mean(int8_scores['dev_mse']) - np.mean(float_scores['dev_mse']))
+    for aspect, p_float, p_int8 in zip(model.aspects, float_scores['test_precision'],
+                                       int8_scores['test_precision']):
+        if p_float is None:
+            continue
+        print "aspect {:} precision: {:.4f} -> {:.4f} ({:+.4f})".format(aspect, p_float, p_int8, p_int8 - p_float)
+    print "Quantized graph written to {:}".format(out_path)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import time
+import json
+import threading
+import argparse
+import urllib2
+
+import numpy as np
+
+from preprocess import myio_read_annotations
+
+'''
+Local load generator for rationale_server.py: replays reviews from an
+annotation file with concurrent clients and reports client-side latency
+and throughput next to the server's own /stats
+'''
+
+def run_client(url, reviews, n_requests, offset, latencies):
+    for i in xrange(n_requests):
+        review = " ".join(reviews[(offset + i) % len(reviews)])
+        start = time.time()
+        request = urllib2.Request(url + "/score", json.dumps({"review": review}),
+                                  {"Content-Type": "application/json"})
+        urllib2.urlopen(request).read()
+        latencies.append(time.time() - start)
+
+def main():
+    argparser = argparse.ArgumentParser(description="Load test a running rationale_server.py")
+    argparser.add_argument("reviews", help="annotation file to take reviews from")
+    argparser.add_argument("--url", default="http://127.0.0.1:8500")
+    argparser.add_argument("--clients", type=int, default=32)
+    argparser.add_argument("--requests", type=int, default=200,
+                           help="requests sent by each client")
+    args = argparser.parse_args()
+
+    reviews, _, _ = myio_read_annotations(args.reviews)
+    latencies = [ [ ] for _ in xrange(args.clients) ]
+    clients = [ threading.Thread(target=run_client,
+                                 args=(args.url, reviews, args.requests,
+                                       i * args.requests, latencies[i]))
+                for i in xrange(args.clients) ]
+    start = time.time()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.time() - start
+
+    latencies = np.concatenate([ np.array(l) for l in latencies ]) * 1000.0
+    print "{:} requests from {:} clients in {:.2f}s ({:.1f} req/s)".format(
+        len(latencies), args.clients, elapsed, len(latencies) / elapsed)
+    print "client latency p50 {:.1f} ms, p99 {:.1f} ms".format(
+        np.percentile(latencies, 50), np.percentile(latencies, 99))
+    print "server stats:", urllib2.urlopen(args.url + "/stats").read()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+import sys
+import time
+import json
+import threading
+import argparse
+import Queue
+from collections import deque
+from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+from SocketServer import ThreadingMixIn
+
+import numpy as np
+
+from frozen_generator import FrozenGenerator
+
+'''
+Online rationale scoring: an HTTP server around a FrozenGenerator that
+groups concurrent requests into micro-batches
+
+    POST /score   {"review": "pours a hazy gold ..."}
+                  -> {"score": 0.71, "rationale": ["hazy", "gold", ...]}
+    GET  /stats   -> latency percentiles, throughput and batch sizes
+'''
+
+class LatencyStats(object):
+    '''
+        Thread-safe record of the latest request latencies and batch sizes
+    '''
+    def __init__(self, window=10000):
+        self.lock = threading.Lock()
+        self.latencies = deque(maxlen=window)
+        self.batch_sizes = deque(maxlen=window)
+        self.start = time.time()
+        self.n_requests = 0
+
+    def add_batch(self, latencies):
+        with self.lock:
+            self.latencies.extend(latencies)
+            self.batch_sizes.append(len(latencies))
+            self.n_requests += len(latencies)
+
+    def report(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000.0
+            batch_sizes = np.array(self.batch_sizes)
+            n_requests = self.n_requests
+        elapsed = max(time.time() - self.start, 1e-6)
+        if len(latencies) == 0:
+            return {"requests": 0}
+        return {"requests": n_requests,
+                "throughput": n_requests / elapsed,
+                "p50_ms": float(np.percentile(latencies, 50)),
+                "p99_ms": float(np.percentile(latencies, 99)),
+                "mean_batch_size": float(batch_sizes.mean())}
+
+
+class MicroBatcher(object):
+    '''
+        Collects requests from the handler threads and scores them on one
+        worker thread. A batch is closed when it holds @max_batch_size
+        reviews or @max_wait seconds after its first review arrived, and is
+        run with a single session call.
+    '''
+    def __init__(self, generator, max_batch_size=64, max_wait=0.005):
+        self.generator = generator
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.requests = Queue.Queue()
+        self.stats = LatencyStats()
+        worker = threading.Thread(target=self._run)
+        worker.daemon = True
+        worker.start()
+
+    def score(self, tokens):
+        '''
+        Blocking call from a handler thread
+        :return: aspect score and the rationale words of @tokens
+        '''
+        request = {"tokens": tokens, "arrival": time.time(),
+                   "done": threading.Event()}
+        self.requests.put(request)
+        request["done"].wait()
+        if "error" in request:
+            raise request["error"]
+        return request["score"], request["rationale"]
+
+    def _next_batch(self):
+        batch = [self.requests.get()]
+        deadline = batch[0]["arrival"] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=timeout))
+            except Queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                rows = self.generator.map_to_ids([ r["tokens"] for r in batch ])
+                x, mask, sentLen = self.generator.pad(rows, np.arange(len(batch)))
+                scores, zPreds = self.generator.predict_batch(x, mask, sentLen)
+                for r, score, z, l in zip(batch, scores, zPreds, sentLen):
+                    r["score"] = float(score)
+                    r["rationale"] = [ w for w, keep in zip(r["tokens"][:l], z[:l]) if keep ]
+            except Exception as e:
+                for r in batch:
+                    r["error"] = e
+            finished = time.time()
+            self.stats.add_batch([ finished - r["arrival"] for r in batch ])
+            for r in batch:
+                r["done"].set()
+
+
+class RationaleHandler(BaseHTTPRequestHandler):
+
+    def _reply(self, code, body):
+        body = json.dumps(body)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._reply(200, self.server.batcher.stats.report())
+        else:
+            self._reply(404, {"error": "unknown path"})
+
+    def do_POST(self):
+        if self.path != "/score":
+            self._reply(404, {"error": "unknown path"})
+            return
+        try:
+            length = int(self.headers.getheader("Content-Length", 0))
+            review = json.loads(self.rfile.read(length))["review"]
+        except (ValueError, KeyError, TypeError):
+            review = None
+        if not isinstance(review, basestring):
+            self._reply(400, {"error": "expected {\"review\": \"...\"}"})
+            return
+        try:
+            score, rationale = self.server.batcher.score(review.lower().split())
+        except Exception as e:
+            self._reply(500, {"error": "{:}: {:}".format(type(e).__name__, e)})
+            return
+        self._reply(200, {"score": score, "rationale": rationale})
+
+    def log_message(self, format, *args):
+        # per-request logging would dominate the latency; see /stats
+        pass
+
+
+class RationaleServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, batcher):
+        HTTPServer.__init__(self, address, RationaleHandler)
+        self.batcher = batcher
+
+
+def main():
+    argparser = argparse.ArgumentParser(
+        description="Serve aspect scores and rationales from an exported generator")
+    argparser.add_argument("--graph", default="./generator.pb",
+                           help="frozen graph written by export_inference_graph")
+    argparser.add_argument("--host", default="127.0.0.1")
+    argparser.add_argument("--port", type=int, default=8500)
+    argparser.add_argument("--max_batch_size", type=int, default=64)
+    argparser.add_argument("--max_wait_ms", type=float, default=5.0)
+    argparser.add_argument("--stats_every", type=float, default=30.0,
+                           help="seconds between latency reports (0 disables them)")
+    args = argparser.parse_args()
+
+    generator = FrozenGenerator(args.graph)
+    batcher = MicroBatcher(generator, args.max_batch_size, args.max_wait_ms / 1000.0)
+    server = RationaleServer((args.host, args.port), batcher)
+    print "Serving {:} on http://{:}:{:}".format(args.graph, args.host, args.port)
+
+    if args.stats_every > 0:
+        def report():
+            while True:
+                time.sleep(args.stats_every)
+                print json.dumps(batcher.stats.report())
+                sys.stdout.flush()
+        reporter = threading.Thread(target=report)
+        reporter.daemon = True
+        reporter.start()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        generator.close()
+
+if __name__ == '__main__':
+    main()
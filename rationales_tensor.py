@@ -13,7 +13,14 @@ def myio_read_rationales(path):
             data.append(item)
     return data
 
-def read_rationales_as_array(path):
+def read_rationales_as_array(path, aspect=0):
+    return read_rationales_as_arrays(path, [aspect])[0]
+
+def read_rationales_as_arrays(path, aspects):
+    '''
+    One 0/1 rationale matrix (reviews x words) per aspect in @aspects; an
+    aspect without annotations gets an all-zero matrix
+    '''
     # read in raw text
     rationale_data = myio_read_rationales(path)
 
@@ -22,16 +29,55 @@ def read_rationales_as_array(path):
     for i in xrange(0, len(rationale_data)):
         max_len = max(len(rationale_data[i]["x"]), max_len)
 
-    rationale_array = np.zeros((len(rationale_data), max_len), dtype=np.int32)
+    rationale_arrays = [ ]
+    for aspect in aspects:
+        rationale_array = np.zeros((len(rationale_data), max_len), dtype=np.int32)
 
-    for i in xrange(0, len(rationale_data)):
-        for j in xrange(0, len(rationale_data[i]["0"])):
-            begin_idx = rationale_data[i]["0"][j][0]
-            end_idx = rationale_data[i]["0"][j][1]
-            words = rationale_data[i]["x"]
-            rationale_array[i, begin_idx:end_idx] = 1
+        for i in xrange(0, len(rationale_data)):
+            for begin_idx, end_idx in rationale_data[i].get(str(aspect), [ ]):
+                rationale_array[i, begin_idx:end_idx] = 1
+        rationale_arrays.append(rationale_array)
+
+    return rationale_arrays
+
+def rationale_prefix_sums(rationale_array):
+    '''
+    prefix[i, j] is the number of rationale words among the first j words
+    of review i, so span [s, e) of review i holds prefix[i, e] - prefix[i, s]
+    rationale words
+    '''
+    prefix = np.zeros((rationale_array.shape[0], rationale_array.shape[1] + 1),
+                      dtype=np.int32)
+    np.cumsum(rationale_array, axis=1, out=prefix[:, 1:])
+    return prefix
+
+def span_precision_recall(prefix, starts, span_lens, rows=None):
+    '''
+    Score predicted span starts against the rationales for several span
+    lengths at once, with one gather per length
+    :param prefix: rationale_prefix_sums of the rationale matrix
+    :param starts: predicted start word of each review
+    :param span_lens: lengths of the spans [start, start + length) to score
+    :param rows: rationale row of each start (default: 0 .. len(starts) - 1)
+    :return: dict mapping each span length to (rationale words in the spans,
+    words in the spans, precision, recall)
+    '''
+    starts = np.asarray(starts, dtype=np.int64)
+    rows = np.arange(len(starts)) if rows is None else np.asarray(rows)
+    width = prefix.shape[1] - 1
+    begin = np.minimum(starts, width)
+    before = prefix[rows, begin]
+    n_rationale = int(prefix[rows, width].sum())
 
-    return rationale_array
+    scores = {}
+    for span_len in span_lens:
+        end = np.minimum(starts + span_len, width)
+        correct = int((prefix[rows, end] - before).sum())
+        predicted = int((end - begin).sum())
+        scores[span_len] = (correct, predicted,
+                            correct / float(max(predicted, 1)),
+                            correct / float(max(n_rationale, 1)))
+    return scores
 
 
 # read_rationales_as_array('/Users/henryneeb/CS224N-Project/source/rcnn-master/beer/annotations.json')
@@ -0,0 +1,53 @@
+import numpy as np
+import tensorflow as tf
+
+from config import Config
+from generator import RNNGeneratorModel
+from utils.general_utils import test_all_close
+
+'''
+Checks of RNNGeneratorModel.token_cost: the cost of a review must not
+depend on the width its bucket pads it to
+'''
+
+def token_cost_graph(width):
+    # only the pieces token_cost reads: the config and the mask
+    model = RNNGeneratorModel.__new__(RNNGeneratorModel)
+    model.config = Config()
+    model.maskPH = tf.placeholder(dtype=tf.bool, shape=(None, width))
+    predPH = tf.placeholder(dtype=tf.float32, shape=(None, 1))
+    labelsPH = tf.placeholder(dtype=tf.float32, shape=(None, 1))
+    crossEntropyPH = tf.placeholder(dtype=tf.float32, shape=(None, width))
+    cost = model.token_cost(predPH, labelsPH, crossEntropyPH)
+    return cost, (model.maskPH, predPH, labelsPH, crossEntropyPH)
+
+def padded_batch(crossEntropy, lengths, width, rng):
+    # padding positions get the (nonzero) cross entropy the generator
+    # produces there
+    mask = np.arange(width)[None, :] < np.array(lengths)[:, None]
+    batch = rng.uniform(0.1, 2.0, size=(len(lengths), width)).astype(np.float32)
+    for i, length in enumerate(lengths):
+        batch[i, :length] = crossEntropy[i][:length]
+    return mask, batch
+
+def test_token_cost_padding_width():
+    rng = np.random.RandomState(0)
+    lengths = [5, 3, 1]
+    crossEntropy = [ rng.uniform(0.0, 1.0, size=5).astype(np.float32) for _ in lengths ]
+    pred = rng.uniform(-1.0, 1.0, size=(3, 1)).astype(np.float32)
+    labels = rng.uniform(-1.0, 1.0, size=(3, 1)).astype(np.float32)
+
+    costs = [ ]
+    for width in [5, 12]:
+        with tf.Graph().as_default():
+            cost, (maskPH, predPH, labelsPH, crossEntropyPH) = token_cost_graph(width)
+            mask, batch = padded_batch(crossEntropy, lengths, width, rng)
+            with tf.Session() as sess:
+                costs.append(sess.run(cost, feed_dict={maskPH: mask,
+                                                       predPH: pred,
+                                                       labelsPH: labels,
+                                                       crossEntropyPH: batch}))
+    test_all_close("token_cost padded to 5 and 12 words", costs[1], costs[0])
+
+if __name__ == '__main__':
+    test_token_cost_padding_width()
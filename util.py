@@ -16,6 +16,8 @@ from collections import defaultdict, Counter, OrderedDict
 import numpy as np
 from numpy import array, zeros, allclose
 
+from utils.general_utils import load_vectors
+
 logger = logging.getLogger("hw3")
 logger.setLevel(logging.DEBUG)
 logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.DEBUG)
@@ -107,13 +109,13 @@ def load_word_vector_mapping(vocab_fstream, vector_fstream):
     """
     Load word vector mapping using @vocab_fstream, @vector_fstream.
     Assumes each line of the vocab file matches with those of the vector
-    file.
+    file; blank lines are skipped in both.
     """
-    ret = OrderedDict()
-    for vocab, vector in zip(vocab_fstream, vector_fstream):
-        vocab = vocab.strip()
-        vector = vector.strip()
-        ret[vocab] = array(list(map(float, vector.split())))
+    vocab = [v.strip() for v in vocab_fstream if v.strip()]
+    _, vectors = load_vectors(vector_fstream, with_words=False)
+    assert len(vocab) == len(vectors), \
+        "{} words but {} vectors".format(len(vocab), len(vectors))
+    ret = OrderedDict(zip(vocab, vectors))
 
     return ret
 
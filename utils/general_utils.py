@@ -1,5 +1,11 @@
+import os
 import sys
+import json
 import time
+import gzip
+import itertools
+import threading
+import Queue
 import numpy as np
 
 
@@ -51,10 +57,331 @@ def get_minibatches_test(dataX, dataY, sentLen, mask, rationals, minibatch_size,
         minibatch_indices = indices[minibatch_start:minibatch_start + minibatch_size]
         yield [dataX[minibatch_indices], dataY[minibatch_indices], sentLen[minibatch_indices], mask[minibatch_indices], rationals[minibatch_indices]]
 
+def get_ragged_minibatches(dataX, dataY, pad_id, minibatch_size, width=None,
+                           rationals=None, shuffle=True):
+    """
+    Like get_minibatches, but dataX is a preprocess.RaggedArray of token ids
+    that is only padded (with pad_id) when each minibatch is drawn.
+
+    Args:
+        dataX: RaggedArray of reviews
+        dataY: labels, indexed by review
+        pad_id: id used to fill reviews shorter than the batch width
+        minibatch_size: the maximum number of items in a minibatch
+        width: columns of each padded batch; longer reviews are truncated.
+            If None, each batch is padded to its own longest review
+        rationals: optional dense rationale matrix, sliced to the batch width
+        shuffle: whether to randomize the order of returned data
+    Returns:
+        minibatches: [x, y, sentLen, mask] for each minibatch, with the
+            batch's rationals appended when rationals is given
+    """
+    data_size = len(dataX)
+    indices = np.arange(data_size)
+    if shuffle:
+        np.random.shuffle(indices)
+    for minibatch_start in np.arange(0, data_size, minibatch_size):
+        minibatch_indices = indices[minibatch_start:minibatch_start + minibatch_size]
+        x, mask, sentLen = dataX.pad(minibatch_indices, pad_id, width)
+        batch = [x, dataY[minibatch_indices], sentLen, mask]
+        if rationals is not None:
+            batch.append(rationals[minibatch_indices, :x.shape[1]])
+        yield batch
+
+def get_length_buckets(lengths, n_buckets, max_length):
+    """
+    Picks bucket boundaries at evenly spaced percentiles of the review
+    lengths (capped at max_length), so each bucket holds a similar number of
+    reviews. The last boundary is always max_length.
+    """
+    lengths = np.minimum(lengths, max_length)
+    percentiles = np.linspace(0, 100, n_buckets + 1)[1:]
+    boundaries = set(int(np.ceil(q)) for q in np.percentile(lengths, percentiles))
+    boundaries.add(max_length)
+    return sorted(b for b in boundaries if b > 0)
+
+
+def apply_length_policy(lengths, policy, n_buckets, percentile=95.0, cap=300,
+                        bucket_caps=None):
+    """
+    Picks the truncation length of the reviews, which is also the longest
+    RNN unroll, and the length bucket boundaries batches are padded to.
+
+    Args:
+        lengths: review lengths of the corpus the policy is fit on
+        policy: one of
+            - "fixed": truncate every review to cap tokens
+            - "percentile": truncate to the given percentile of lengths
+              (at most cap), trading the longest reviews' tails for shorter
+              unrolls everywhere
+            - "buckets": use bucket_caps as the bucket boundaries, so each
+              bucket is padded and truncated to its own cap; the largest
+              cap is the truncation length
+        n_buckets: number of percentile buckets for "fixed"/"percentile"
+    Returns:
+        max_length: truncation length (store it with the checkpoint)
+        boundaries: sorted bucket boundaries, the last one max_length
+    """
+    lengths = np.asarray(lengths)
+    if policy == "fixed":
+        max_length = int(cap)
+    elif policy == "percentile":
+        max_length = int(np.ceil(np.percentile(lengths, percentile)))
+        max_length = max(1, min(max_length, int(cap)))
+    elif policy == "buckets":
+        max_length = max(int(b) for b in bucket_caps)
+    else:
+        raise ValueError("unknown length policy: {:}".format(policy))
+
+    if policy == "buckets":
+        boundaries = sorted(set(int(b) for b in bucket_caps))
+    else:
+        boundaries = get_length_buckets(lengths, n_buckets, max_length)
+    sys.stdout.write("length policy {:}: truncating to {:} tokens ({:.1%} of reviews cut)\n"
+                     .format(policy, max_length, np.mean(lengths > max_length)))
+    return max_length, boundaries
+
+
+def get_bucket_batches(lengths, minibatch_size, boundaries, shuffle=True):
+    """
+    Groups reviews of similar length into minibatches. A review of length l
+    goes to the first bucket whose boundary is >= l (longer reviews go to the
+    last bucket and are truncated), and every batch is drawn from a single
+    bucket. With shuffle, reviews are shuffled within each bucket and the
+    batches are shuffled across buckets, so every epoch sees a new order.
+
+    Returns:
+        a list of (review indices, padded width) pairs, one per minibatch
+    """
+    boundaries = np.asarray(boundaries)
+    bucket_ids = np.minimum(np.searchsorted(boundaries, lengths),
+                            len(boundaries) - 1)
+    batches = []
+    for bucket, width in enumerate(boundaries):
+        members = np.flatnonzero(bucket_ids == bucket)
+        if shuffle:
+            np.random.shuffle(members)
+        for start in np.arange(0, len(members), minibatch_size):
+            batches.append((members[start:start + minibatch_size], int(width)))
+    if shuffle:
+        batches = [batches[i] for i in np.random.permutation(len(batches))]
+    return batches
+
+
+def get_bucketed_minibatches(dataX, dataY, pad_id, batches, rationals=None):
+    """
+    Materializes the minibatches returned by get_bucket_batches, padding
+    each one only to its bucket boundary. Yields the same lists as
+    get_ragged_minibatches.
+    """
+    for minibatch_indices, width in batches:
+        x, mask, sentLen = dataX.pad(minibatch_indices, pad_id, width)
+        batch = [x, dataY[minibatch_indices], sentLen, mask]
+        if rationals is not None:
+            batch.append(rationals[minibatch_indices, :width])
+        yield batch
+
+class BatchPrefetcher(object):
+    """
+    Iterates over minibatches built by a background thread, so padding and
+    gathering the next batches overlaps with sess.run (which releases the
+    GIL) instead of stalling it. Up to n_prefetch batches are kept ready,
+    each array copied into its own contiguous buffer ready to be fed.
+
+        batches = BatchPrefetcher(get_bucketed_minibatches(...), 4)
+        for x, y, sentLen, mask in batches:
+            ...
+            prog.update(i + 1, [("queue depth", batches.depth)])
+
+    Args:
+        batches: iterable of minibatches (lists of np.ndarrays)
+        n_prefetch: number of batches built ahead; 0 builds them on the
+            calling thread
+    Attributes:
+        depth: ready batches in the queue when the last batch was taken. It
+            stays near 0 when training is input bound and near n_prefetch
+            when it is compute bound
+    """
+    _end = object()
+
+    def __init__(self, batches, n_prefetch=4):
+        self.batches = batches
+        self.n_prefetch = n_prefetch
+        self.depth = 0
+        if n_prefetch > 0:
+            self.queue = Queue.Queue(maxsize=n_prefetch)
+            self.error = None
+            producer = threading.Thread(target=self._produce)
+            producer.daemon = True
+            producer.start()
+
+    def _produce(self):
+        try:
+            for batch in self.batches:
+                self.queue.put([np.ascontiguousarray(b) for b in batch])
+        except Exception:
+            self.error = sys.exc_info()
+        self.queue.put(self._end)
+
+    def __iter__(self):
+        if self.n_prefetch <= 0:
+            for batch in self.batches:
+                yield batch
+            return
+        while True:
+            self.depth = self.queue.qsize()
+            batch = self.queue.get()
+            if batch is self._end:
+                if self.error is not None:
+                    raise self.error[0], self.error[1], self.error[2]
+                return
+            yield batch
+
+
+class AsyncCheckpointWriter(object):
+    """
+    Writes training checkpoints on a background thread, so training only
+    waits for the variables to be fetched, not for the disk. A checkpoint is
+    one .npz file holding the arrays and the JSON state; it is written to a
+    temporary file and renamed, so the file on disk is always the last
+    complete checkpoint.
+
+        writer = AsyncCheckpointWriter('./generator.ckpt')
+        writer.save({'var0': ...}, {'epoch': 3, 'step': 1200})
+        ...
+        writer.wait()
+        arrays, state = load_checkpoint('./generator.ckpt')
+
+    Args:
+        path: checkpoint path, written as path + ".npz"
+    """
+    def __init__(self, path):
+        self.path = path
+        self.thread = None
+        self.error = None
+
+    def save(self, arrays, state):
+        """
+        Starts writing @arrays (name -> np.ndarray) and @state (JSON
+        serializable), after the previous write has finished
+        """
+        self.wait()
+        self.thread = threading.Thread(target=self._write, args=(arrays, state))
+        self.thread.start()
+
+    def _write(self, arrays, state):
+        try:
+            tmp_path = "{}.npz.{}.tmp".format(self.path, os.getpid())
+            with open(tmp_path, "wb") as fout:
+                np.savez(fout, __state__=np.array(json.dumps(state)), **arrays)
+            os.rename(tmp_path, self.path + ".npz")
+        except Exception:
+            self.error = sys.exc_info()
+
+    def wait(self):
+        """
+        Blocks until the pending write is done; re-raises its error
+        """
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error[0], error[1], error[2]
+
+
+def load_checkpoint(path):
+    """
+    Reads a checkpoint written by AsyncCheckpointWriter
+    Returns:
+        the arrays (name -> np.ndarray) and the state, or (None, None) if
+        there is no checkpoint at path
+    """
+    if not os.path.exists(path + ".npz"):
+        return None, None
+    with np.load(path + ".npz") as npz:
+        arrays = dict((name, npz[name]) for name in npz.files if name != "__state__")
+        state = json.loads(str(npz["__state__"]))
+    return arrays, state
+
+
 def minibatch(data, minibatch_idx):
     return data[minibatch_idx] if type(data) is np.ndarray else [data[i] for i in minibatch_idx]
 
 
+def load_vectors(lines, with_words=True, chunk_rows=50000, verbose=True, extra_rows=0):
+    """
+    Parses GloVe-style text vectors (one "word v1 v2 ... vd" per line) in
+    chunks. Each chunk is joined and converted with numpy's native
+    string-to-float parser into a preallocated float32 matrix, instead of
+    calling float() on every component.
+
+    Args:
+        lines: an iterable of text lines, e.g. an open (gzip) file
+        with_words: whether each line starts with its word
+        chunk_rows: number of lines converted per chunk
+        verbose: whether to print the parse rate in rows per second
+        extra_rows: zeroed rows reserved after the parsed ones, so a caller
+            can append vectors without copying the matrix
+    Returns:
+        words: list of words (None if with_words is False)
+        vectors: float32 np.ndarray of shape (n_rows + extra_rows, dim)
+    """
+    start = time.time()
+    lines = iter(lines)
+    words = [] if with_words else None
+    vectors = np.zeros((0, 0), dtype=np.float32)
+    n_rows = 0
+    while True:
+        chunk = list(itertools.islice(lines, chunk_rows))
+        if not chunk:
+            break
+        # blank lines are skipped, but only the end of the input stops
+        chunk = [line for line in chunk if line.strip()]
+        if not chunk:
+            continue
+        if with_words:
+            chunk = [line.split(None, 1) for line in chunk]
+            words.extend(parts[0] for parts in chunk)
+            chunk = [parts[1] if len(parts) > 1 else "" for parts in chunk]
+        block = np.fromstring(" ".join(chunk), dtype=np.float32, sep=" ")
+        if n_rows == 0:
+            dim = block.size // len(chunk)
+            vectors = np.empty((len(chunk) + extra_rows, dim), dtype=np.float32)
+        if block.size != len(chunk) * dim:
+            raise ValueError("ragged vectors near row {:}: expected dimension {:}"
+                             .format(n_rows, dim))
+        if n_rows + len(chunk) + extra_rows > vectors.shape[0]:
+            grown = np.empty((max(2 * vectors.shape[0], n_rows + len(chunk) + extra_rows), dim),
+                             dtype=np.float32)
+            grown[:n_rows] = vectors[:n_rows]
+            vectors = grown
+        vectors[n_rows:n_rows + len(chunk)] = block.reshape(len(chunk), dim)
+        n_rows += len(chunk)
+    if n_rows > 0:
+        # give back the unused part of the growth buffer; no other array
+        # refers to it, so it can be shrunk in place
+        vectors.resize((n_rows + extra_rows, dim), refcheck=False)
+        vectors[n_rows:] = 0.0
+
+    if verbose:
+        elapsed = max(time.time() - start, 1e-6)
+        sys.stdout.write("{:} vectors parsed in {:.2f}s ({:.0f} rows/s)\n"
+                         .format(n_rows, elapsed, n_rows / elapsed))
+        sys.stdout.flush()
+    return words, vectors
+
+
+def load_embedding_file(path, **kwargs):
+    """
+    Opens a (possibly gzipped) GloVe-style embedding file and parses it with
+    load_vectors. Returns the word list and float32 vector matrix.
+    """
+    fopen = gzip.open if path.endswith(".gz") else open
+    with fopen(path) as fin:
+        return load_vectors(fin, **kwargs)
+
+
 def test_all_close(name, actual, expected):
     if actual.shape != expected.shape:
         raise ValueError("{:} failed, expected output to have shape {:} but has shape {:}"
@@ -6,7 +6,7 @@ import time
 import os
 import logging
 from collections import Counter
-from general_utils import logged_loop, get_minibatches
+from general_utils import logged_loop, get_minibatches, load_embedding_file
 from q2_parser_transitions import PartialParse, minibatch_parse
 
 import numpy as np
@@ -361,10 +361,8 @@ def load_and_preprocess_data(reduced=True):
 
     print "Loading pretrained embeddings...",
     start = time.time()
-    word_vectors = {}
-    for line in open(config.embedding_file).readlines():
-        sp = line.strip().split()
-        word_vectors[sp[0]] = [float(x) for x in sp[1:]]
+    words, vectors = load_embedding_file(config.embedding_file)
+    word_vectors = dict(zip(words, vectors))
     embeddings_matrix = np.asarray(np.random.normal(0, 0.9, (parser.n_tokens, 50)), dtype='float32')
 
     for token in parser.tok2id: